@@ -0,0 +1,101 @@
+# Локальная замена OpenWeather для нагрузочных тестов: отдает JSON из fixtures/
+# с настраиваемой задержкой и долей ошибок.
+# Запуск: python -m benchmarks.fake_openweather --port 8900 --latency-ms 80 --error-rate 0.01
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from pathlib import Path
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+FIXTURES_DIR = Path(__file__).resolve().parent.parent / "fixtures"
+GEO_RESPONSE = json.loads((FIXTURES_DIR / "find_locs_from_openweather_api.json").read_text())
+WEATHER_RESPONSE = json.loads((FIXTURES_DIR / "get_weather_from_openweather_api.json").read_text())
+
+config = {"latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0}
+calls = Counter()
+# id городов выдаются по координатам, чтобы /group мог вернуть погоду по ранее выданному id
+city_ids: dict[tuple[float, float], int] = {}
+city_coordinates: dict[int, tuple[float, float]] = {}
+
+
+def city_weather(latitude: float, longitude: float) -> dict:
+    city_id = city_ids.setdefault((latitude, longitude), 1_000_000 + len(city_ids))
+    city_coordinates[city_id] = (latitude, longitude)
+    return {**WEATHER_RESPONSE, "coord": {"lat": latitude, "lon": longitude}, "id": city_id, "dt": int(time.time())}
+
+
+async def simulate_upstream(endpoint: str) -> JSONResponse | None:
+    calls[endpoint] += 1
+    delay_ms = config["latency_ms"] + random.uniform(-config["jitter_ms"], config["jitter_ms"])
+    if delay_ms > 0:
+        await asyncio.sleep(delay_ms / 1000)
+    if random.random() < config["error_rate"]:
+        calls[f"{endpoint}_errors"] += 1
+        return JSONResponse({"cod": 500, "message": "Injected error"}, status_code=500)
+    return None
+
+
+async def geo_direct(request: Request) -> JSONResponse:
+    return await simulate_upstream("geo") or JSONResponse(GEO_RESPONSE)
+
+
+async def weather(request: Request) -> JSONResponse:
+    error = await simulate_upstream("weather")
+    if error:
+        return error
+    latitude, longitude = float(request.query_params["lat"]), float(request.query_params["lon"])
+    return JSONResponse(city_weather(latitude, longitude))
+
+
+async def group(request: Request) -> JSONResponse:
+    error = await simulate_upstream("group")
+    if error:
+        return error
+    requested = [int(city_id) for city_id in request.query_params["id"].split(",")]
+    if len(requested) > 20:
+        return JSONResponse({"cod": "400", "message": "Too many ids"}, status_code=400)
+    weather_list = [city_weather(*city_coordinates[city_id]) for city_id in requested if city_id in city_coordinates]
+    return JSONResponse({"cnt": len(weather_list), "list": weather_list})
+
+
+async def stats(request: Request) -> JSONResponse:
+    return JSONResponse(dict(calls))
+
+
+async def reset(request: Request) -> JSONResponse:
+    calls.clear()
+    return JSONResponse({})
+
+
+app = Starlette(routes=[
+    Route("/geo/1.0/direct", geo_direct),
+    Route("/data/2.5/weather", weather),
+    Route("/data/2.5/group", group),
+    Route("/_stats", stats),
+    Route("/_reset", reset, methods=["POST"]),
+])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline OpenWeather stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    config.update(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+# Нагрузочный тест сервиса против локальной замены OpenWeather (benchmarks/fake_openweather.py).
+# Полностью офлайн: SQLite во временном каталоге, без Redis (или --redis-url), приложение под uvicorn.
+# Запуск: python -m benchmarks.load_test --duration 30 --concurrency 20 --output bench.json --compare old.json
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+ROUTE_WEIGHTS = {"/": 50, "/locations": 25, "/add_location": 10, "/delete_location": 10, "/token": 5}
+CITIES = ["Сан-Паулу", "San Paolo", "San", "Сан", "Briga"]
+LOCATION_ID_RE = re.compile(r'name="location_id"[^>]*value="(\d+)"')
+REQUIRED_SETTINGS = {"POSTGRES_DB": "weather", "POSTGRES_USER": "benchmark", "POSTGRES_PASSWORD": "benchmark",
+                     "POSTGRES_HOST": "127.0.0.1", "POSTGRES_PORT": "5432", "PAGE_SIZE": "5",
+                     "WEATHER_API_KEY": "benchmark", "REDIS_PASSWORD": "benchmark", "SECRET_KEY": "benchmark",
+                     "ALGORITHM": "HS256", "ACCESS_TOKEN_EXPIRE_MINUTES": "180"}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline load test for WeatherService")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="seconds of traffic excluded from the report")
+    parser.add_argument("--concurrency", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--users", type=int, default=10, help="registered accounts shared by virtual users")
+    parser.add_argument("--locations-per-user", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers of the service")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="injected upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of failed upstream calls")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--quota-per-minute", type=int, default=1_000_000, help="OpenWeather calls per minute")
+    parser.add_argument("--redis-url", help="use this Redis for shared caches (default: no Redis)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here")
+    parser.add_argument("--compare", help="JSON report of a previous run to diff against")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def service_env(args: argparse.Namespace, db_path: Path, fake_port: int) -> dict:
+    env = {**REQUIRED_SETTINGS, **os.environ}
+    env.pop("PYTEST_VERSION", None)
+    env.update(DATABASE_URL=f"sqlite:///{db_path}", ASYNC_DATABASE_URL=f"sqlite+aiosqlite:///{db_path}",
+               WEATHER_API_URL=f"http://127.0.0.1:{fake_port}", BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+               REDIS_ENABLED="true" if args.redis_url else "false",
+               # Поддельный API не ограничивает запросы; квота не должна искажать замеры
+               WEATHER_API_CALLS_PER_MINUTE=str(args.quota_per_minute))
+    if args.redis_url:
+        env["REDIS_URL"] = args.redis_url
+    return env
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode}")
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} is not ready after {timeout}s")
+
+
+class VirtualUser:
+
+    def __init__(self, base_url: str, login: str, rng: random.Random):
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=60)
+        self.login = login
+        self.password = "benchmark1"
+        self.rng = rng
+        self.location_ids: list[str] = []
+
+    async def sign_up(self, locations: int) -> None:
+        await self.client.post("/register", data={"login": self.login, "password": self.password,
+                                                  "repeated_password": self.password})
+        await self.client.post("/token", data={"login": self.login, "password": self.password})
+        for _ in range(locations):
+            await self.add_location()
+
+    async def main_page(self) -> httpx.Response:
+        response = await self.client.get("/")
+        self.location_ids = LOCATION_ID_RE.findall(response.text)
+        return response
+
+    async def search(self) -> httpx.Response:
+        return await self.client.get("/locations", params={"city": self.rng.choice(CITIES)})
+
+    async def token(self) -> httpx.Response:
+        return await self.client.post("/token", data={"login": self.login, "password": self.password})
+
+    async def add_location(self) -> httpx.Response:
+        latitude, longitude = self.rng.uniform(-80, 80), self.rng.uniform(-170, 170)
+        return await self.client.post("/add_location", data={
+            "name": f"Бенчмарк {latitude:.2f}", "lat": f"{latitude:.4f}", "lon": f"{longitude:.4f}",
+            "country": "RU", "state": "-"})
+
+    async def delete_location(self) -> httpx.Response:
+        location_id = self.location_ids.pop(self.rng.randrange(len(self.location_ids)))
+        return await self.client.post("/delete_location", data={"location_id": location_id,
+                                                                "location_name": "-", "current_page": 1})
+
+    async def request(self, route: str) -> tuple[str, httpx.Response]:
+        if route == "/delete_location" and not self.location_ids:
+            route = "/"
+        action = {"/": self.main_page, "/locations": self.search, "/token": self.token,
+                  "/add_location": self.add_location, "/delete_location": self.delete_location}[route]
+        return route, await action()
+
+
+async def run_traffic(users: list[VirtualUser], args: argparse.Namespace, fake_url: str) -> tuple[dict, float]:
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    routes, weights = list(ROUTE_WEIGHTS), list(ROUTE_WEIGHTS.values())
+    started = time.monotonic()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.duration
+    reset_done = asyncio.Event()
+
+    async def reset_upstream_counters() -> None:
+        await asyncio.sleep(args.warmup)
+        async with httpx.AsyncClient() as client:
+            await client.post(f"{fake_url}/_reset")
+        reset_done.set()
+
+    async def virtual_user_loop(user: VirtualUser) -> None:
+        while time.monotonic() < deadline:
+            route = user.rng.choices(routes, weights)[0]
+            request_started = time.perf_counter()
+            try:
+                route, response = await user.request(route)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            elapsed_ms = (time.perf_counter() - request_started) * 1000
+            if time.monotonic() >= measure_from:
+                samples[route].append(elapsed_ms)
+                errors[route] += failed
+
+    await asyncio.gather(reset_upstream_counters(),
+                         *(virtual_user_loop(users[number % len(users)]) for number in range(args.concurrency)))
+    await reset_done.wait()
+    measured = time.monotonic() - measure_from
+    report = {}
+    for route in routes:
+        latencies = samples.get(route, [])
+        report[route] = {"count": len(latencies), "rps": round(len(latencies) / measured, 2),
+                         "errors": errors.get(route, 0),
+                         "p50": round(percentile(latencies, 50), 2), "p95": round(percentile(latencies, 95), 2),
+                         "p99": round(percentile(latencies, 99), 2)}
+    return report, measured
+
+
+def print_report(report: dict, previous: dict | None) -> None:
+    print(f"\ncommit {report['commit']}  {report['measured_seconds']:.1f}s  total {report['total_rps']} rps")
+    print(f"{'route':18}{'count':>8}{'rps':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, stats in report["routes"].items():
+        line = (f"{route:18}{stats['count']:>8}{stats['rps']:>9}{stats['errors']:>8}"
+                f"{stats['p50']:>10}{stats['p95']:>10}{stats['p99']:>10}")
+        old = (previous or {}).get("routes", {}).get(route)
+        if old and old["p95"]:
+            line += f"   p95 {(stats['p95'] - old['p95']) / old['p95'] * 100:+.0f}% vs {previous['commit']}"
+        print(line)
+    print("upstream calls:", ", ".join(f"{name}={count}" for name, count in report["upstream"].items()))
+
+
+async def main() -> None:
+    args = parse_args()
+    tmp_dir = Path(tempfile.mkdtemp(prefix="weather-bench-"))
+    fake_port, app_port = free_port(), free_port()
+    fake_url, app_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{app_port}"
+    env = service_env(args, tmp_dir / "bench.db", fake_port)
+    create_schema = "import asyncio; from db.models import create_schema; asyncio.run(create_schema())"
+    subprocess.run([sys.executable, "-c", create_schema], cwd=ROOT, env=env, check=True)
+    log_file = open(tmp_dir / "service.log", "w")
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.fake_openweather", "--port", str(fake_port),
+                          "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+                          "--error-rate", str(args.error_rate)], cwd=ROOT, env=env, stderr=log_file),
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port",
+                          str(app_port), "--workers", str(args.workers), "--log-level", "warning"],
+                         cwd=ROOT, env=env, stderr=log_file),
+    ]
+    users = []
+    try:
+        await wait_ready(f"{fake_url}/_stats", processes[0])
+        await wait_ready(f"{app_url}/authorization", processes[1])
+        users = [VirtualUser(app_url, f"bench{number}", random.Random(args.seed + number))
+                 for number in range(args.users)]
+        await asyncio.gather(*(user.sign_up(args.locations_per_user) for user in users))
+        routes, measured = await run_traffic(users, args, fake_url)
+        async with httpx.AsyncClient() as client:
+            upstream = (await client.get(f"{fake_url}/_stats")).json()
+    finally:
+        for user in users:
+            await user.client.aclose()
+        for process in processes:
+            process.terminate()
+            process.wait()
+        log_file.close()
+
+    upstream_per_request = {
+        "geo_per_search": round(upstream.get("geo", 0) / max(routes["/locations"]["count"], 1), 3),
+        "weather_per_main_page": round((upstream.get("weather", 0) + upstream.get("group", 0))
+                                       / max(routes["/"]["count"], 1), 3),
+    }
+    report = {"commit": git_commit(), "params": {key: value for key, value in vars(args).items()
+                                                 if key not in ("output", "compare")},
+              "measured_seconds": round(measured, 2),
+              "total_rps": round(sum(stats["rps"] for stats in routes.values()), 2),
+              "routes": routes, "upstream": {**upstream, **upstream_per_request}}
+    previous = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(report, previous)
+    print(f"service log: {tmp_dir / 'service.log'}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+# Проверка планов запросов к таблице location на большом наборе данных.
+# Запуск: python -m benchmarks.query_plan [--url postgresql+psycopg2://...] [--users 2000] [--per-user 50]
+# Без --url используется временная БД SQLite.
+
+import argparse
+import os
+import tempfile
+import time
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Query plan benchmark for location hot queries")
+    parser.add_argument("--url", help="SQLAlchemy URL of a disposable database (default: temporary SQLite)")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--per-user", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'query_plan.db')}"
+    from sqlalchemy import create_engine, func, insert, select, text
+
+    from db.models import Base, Location, User
+
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(insert(User), [{"login": f"user{number}", "password": "-"}
+                                          for number in range(1, args.users + 1)])
+        connection.execute(insert(Location), [
+            {"name": f"Город {user_id}-{number}", "user_id": user_id, "latitude": number, "longitude": user_id,
+             "country": "RU", "state": "-"}
+            for user_id in range(1, args.users + 1) for number in range(args.per_user)])
+        connection.execute(text("ANALYZE"))
+    print(f"Seeded {args.users * args.per_user} locations in {time.perf_counter() - started:.1f}s")
+
+    user_id = args.users // 2
+    # Поиск по имени обслуживает индекс уникального ограничения name_user_uc: name - его первая колонка
+    unique_index = "sqlite_autoindex_location" if engine.dialect.name == "sqlite" else "name_user_uc"
+    queries = {
+        "get_page": (select(Location).filter(Location.user_id == user_id).order_by(Location.id)
+                     .limit(5).offset(10), "ix_location_user_id_id"),
+        "keyset_page": (select(Location).filter(Location.user_id == user_id, Location.id > 0)
+                        .order_by(Location.id).limit(5), "ix_location_user_id_id"),
+        "count": (select(func.count(Location.id)).filter(Location.user_id == user_id), "ix_location_user_id_id"),
+        "get_one_by_name": (select(Location).filter(Location.name == f"Город {user_id}-7").limit(1),
+                            unique_index),
+    }
+    explain = "EXPLAIN QUERY PLAN" if engine.dialect.name == "sqlite" else "EXPLAIN"
+    failed = []
+    with engine.connect() as connection:
+        for name, (query, index_name) in queries.items():
+            compiled = query.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = " ".join(str(row[-1]) for row in connection.execute(text(f"{explain} {compiled}")))
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                connection.execute(query).all()
+            elapsed_ms = (time.perf_counter() - started) / args.repeat * 1000
+            uses_index = index_name in plan
+            if not uses_index:
+                failed.append(name)
+            print(f"{name:16} {elapsed_ms:8.3f} ms  {'OK ' if uses_index else 'NO INDEX'}  {plan}")
+    engine.dispose()
+    assert not failed, f"Queries without expected index: {', '.join(failed)}"
+
+
+if __name__ == "__main__":
+    main()
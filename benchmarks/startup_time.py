@@ -0,0 +1,87 @@
+# Время импорта main и старта приложения (lifespan) в свежем интерпретаторе, как у нового воркера.
+# Полностью офлайн: SQLite во временном каталоге, без Redis.
+# Запуск: python -m benchmarks.startup_time --runs 10 --budget-ms 1500 [--top 15]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.load_test import REQUIRED_SETTINGS
+
+ROOT = Path(__file__).resolve().parent.parent
+CHILD_CODE = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def run_lifespan():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+    return ready
+
+ready = asyncio.run(run_lifespan())
+print(json.dumps({"import_ms": (imported - started) * 1000, "startup_ms": (ready - imported) * 1000}))
+"""
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Import and startup time of a fresh WeatherService worker")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, help="fail if median import + startup exceeds this")
+    parser.add_argument("--top", type=int, default=0, help="print the slowest imports (python -X importtime)")
+    return parser.parse_args()
+
+
+def child_env(tmp_dir: Path) -> dict:
+    env = {**os.environ, **REQUIRED_SETTINGS}
+    env.update(DATABASE_URL=f"sqlite:///{tmp_dir / 'startup.db'}",
+               ASYNC_DATABASE_URL=f"sqlite+aiosqlite:///{tmp_dir / 'startup.db'}",
+               REDIS_ENABLED="false", LOG_DIR=str(tmp_dir / "logs"), PYTHONDONTWRITEBYTECODE="")
+    return env
+
+
+def slowest_imports(env: dict, top: int) -> list[tuple[float, float, str]]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        rows.append((int(self_us) / 1000, int(cumulative_us) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main() -> None:
+    args = parse_args()
+    env = child_env(Path(tempfile.mkdtemp(prefix="weather-startup-")))
+    # Первый запуск компилирует байткод, в замеры не входит
+    subprocess.run([sys.executable, "-c", CHILD_CODE], cwd=ROOT, env=env, capture_output=True, check=True)
+    runs = []
+    for _ in range(args.runs):
+        result = subprocess.run([sys.executable, "-c", CHILD_CODE], cwd=ROOT, env=env, capture_output=True,
+                                text=True, check=True)
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    totals = [run["import_ms"] + run["startup_ms"] for run in runs]
+    for key in ("import_ms", "startup_ms"):
+        values = [run[key] for run in runs]
+        print(f"{key:<11} median {statistics.median(values):8.1f}   max {max(values):8.1f}")
+    median_total = statistics.median(totals)
+    print(f"{'total_ms':<11} median {median_total:8.1f}   max {max(totals):8.1f}")
+    if args.top:
+        print(f"\n{'self ms':>9} {'cumulative ms':>14}  module")
+        for self_ms, cumulative_ms, name in slowest_imports(env, args.top):
+            print(f"{self_ms:9.1f} {cumulative_ms:14.1f}  {name}")
+    if args.budget_ms and median_total > args.budget_ms:
+        print(f"startup budget exceeded: {median_total:.1f} ms > {args.budget_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import datetime
 import os
+from urllib.parse import quote
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -12,20 +13,141 @@ class Settings(BaseSettings):
     POSTGRES_HOST: str
     POSTGRES_PORT: int
     PAGE_SIZE: int
+    DATABASE_URL: str | None = None
+    ASYNC_DATABASE_URL: str | None = None
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 30 * 60
+    DB_POOL_PRE_PING: bool = True
+    # Создавать таблицы при старте без миграций (локальная разработка на SQLite); в проде схема - alembic
+    DB_CREATE_SCHEMA: bool = False
     WEATHER_API_KEY: str
     REDIS_PASSWORD: str
+    REDIS_URL: str | None = None
+    # Без REDIS_URL адрес собирается из REDIS_HOST (по умолчанию POSTGRES_HOST), порта и REDIS_PASSWORD
+    REDIS_HOST: str | None = None
+    REDIS_PORT: int = 6379
+    REDIS_ENABLED: bool = True
+    # Короткие таймауты: при зависшем Redis кэши, квота и блокировки переходят на локальный режим
+    REDIS_SOCKET_TIMEOUT: float = 0.3
+    REDIS_CONNECT_TIMEOUT: float = 0.3
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    WEATHER_API_URL: str = "https://api.openweathermap.org"
+    WEATHER_API_POOL_SIZE: int = 100
+    WEATHER_API_KEEPALIVE_EXPIRY: float = 30.0
+    WEATHER_API_CONNECT_TIMEOUT: float = 3.0
+    WEATHER_API_READ_TIMEOUT: float = 5.0
+    WEATHER_API_HTTP2: bool = True
+    WEATHER_CONCURRENT_FETCH: bool = True
+    WEATHER_FETCH_CONCURRENCY: int = 10
+    WEATHER_GLOBAL_CONCURRENCY: int = 100
+    WEATHER_BATCH_ENABLED: bool = True
+    WEATHER_BATCH_SIZE: int = 20
+    # Общий срок на вызов API вместе с повторами
+    WEATHER_API_DEADLINE: float = 4.0
+    WEATHER_API_RETRIES: int = 2
+    WEATHER_API_RETRY_BACKOFF: float = 0.2
+    WEATHER_API_RETRY_BACKOFF_MAX: float = 1.0
+    WEATHER_BREAKER_FAILURE_THRESHOLD: int = 5
+    WEATHER_BREAKER_RECOVERY_TIMEOUT: float = 30.0
+    WEATHER_STALE_TTL: int = 6 * 60 * 60
+    # Квота ключа WEATHER_API_KEY, общая для всех воркеров (токен-бакет в Redis)
+    WEATHER_QUOTA_ENABLED: bool = True
+    WEATHER_API_CALLS_PER_MINUTE: int = 60
+    WEATHER_QUOTA_MAX_WAIT: float = 1.0
+    WEATHER_CACHE_TTL: int = 600
+    WEATHER_CACHE_PRECISION: int = 2
+    WEATHER_CACHE_LOCAL_SIZE: int = 1024
+    GEOCODE_CACHE_TTL: int = 7 * 24 * 60 * 60
+    # Пустой результат поиска (опечатка, сбой на стороне geo API) хранится недолго
+    GEOCODE_NEGATIVE_CACHE_TTL: int = 5 * 60
+    GEOCODE_CACHE_LOCAL_SIZE: int = 1024
+    WEATHER_PREFETCH_ENABLED: bool = False
+    WEATHER_PREFETCH_INTERVAL: int = 480
+    WEATHER_PREFETCH_CALLS_PER_MINUTE: int = 50
+    WEATHER_PREFETCH_JITTER: float = 0.2
+    WEATHER_PREFETCH_RECENT_WINDOW: int = 60 * 60
+    # Запись просмотров локаций для очереди фонового обновления. None - только при WEATHER_PREFETCH_ENABLED;
+    # true нужно, если обновление идет отдельным процессом (python -m weather_prefetch)
+    WEATHER_PREFETCH_RECORD_VIEWS: bool | None = None
+    BCRYPT_ROUNDS: int = 12
+    HASHING_POOL_WORKERS: int = 2
+    HASHING_POOL_MAX_QUEUE: int = 32
+    # Число воркеров gunicorn (задает gunicorn.conf.py); делит локальную квоту API без Redis
+    WEB_CONCURRENCY: int = 1
+    HEALTH_CHECK_TIMEOUT: float = 1.0
+    HEALTH_CHECK_CACHE_SECONDS: float = 2.0
+    LOG_DIR: str = "logs"
+    LOG_LEVEL: str = "INFO"
+    LOG_STDERR_LEVEL: str = "WARNING"
+    LOG_QUEUE_SIZE: int = 10000
+    LOG_ROTATION_MB: int = 100
+    LOG_RETENTION_FILES: int = 10
+    # Доля записей о быстрых успешных запросах, попадающих в лог
+    LOG_SAMPLE_RATE: float = 0.1
+    LOG_SLOW_REQUEST_MS: int = 1000
+    PROFILING_ENABLED: bool = False
+    PROFILING_TOKEN: str | None = None
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_DISK_MB: int = 100
+    USER_CACHE_TTL: int = 60
+    USER_CACHE_LOCAL_SIZE: int = 10000
+    SINGLE_FLIGHT_REDIS_LOCK: bool = False
+    SINGLE_FLIGHT_LOCK_TIMEOUT: float = 10.0
+    SINGLE_FLIGHT_WAIT_TIMEOUT: float = 5.0
+    # None - системный временный каталог, общий для всех воркеров
+    TEMPLATE_BYTECODE_CACHE_DIR: str | None = None
+    TEMPLATE_FRAGMENT_CACHE_SIZE: int = 4096
+    # Результат python -m utilites.static_build; без него статика отдается из static/
+    STATIC_BUILD_DIR: str = "static_build"
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 5
+    # Дамп GeoNames (cities500.txt и т.п.) для локального поиска городов; без него индекс пополняется из geo API
+    GAZETTEER_PATH: str | None = None
+    GAZETTEER_MIN_POPULATION: int = 0
+    GAZETTEER_LEARN: bool = True
+    # Предел ключей в индексе мест, выученных из ответов geo API
+    GAZETTEER_LEARN_MAX_KEYS: int = 50_000
+    AUTOCOMPLETE_LIMIT: int = 10
 
     model_config = SettingsConfigDict(env_file=".env")
 
     @property
     def DB_URL(self):
+        if self.DATABASE_URL:
+            return self.DATABASE_URL
         if os.environ.get("PYTEST_VERSION"):
             return "sqlite:///./test_db.db"
         return (f'postgresql+psycopg2://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:'
                 f'{self.POSTGRES_PORT}/{self.POSTGRES_DB}')
 
+    @property
+    def REDIS_CONNECTION_URL(self):
+        if self.REDIS_URL:
+            return self.REDIS_URL
+        return (f"redis://:{quote(self.REDIS_PASSWORD, safe='')}@{self.REDIS_HOST or self.POSTGRES_HOST}:"
+                f"{self.REDIS_PORT}/0")
+
+    @property
+    def RECORD_LOCATION_VIEWS(self):
+        if self.WEATHER_PREFETCH_RECORD_VIEWS is None:
+            return self.WEATHER_PREFETCH_ENABLED
+        return self.WEATHER_PREFETCH_RECORD_VIEWS
+
+    @property
+    def ASYNC_DB_URL(self):
+        if self.ASYNC_DATABASE_URL:
+            return self.ASYNC_DATABASE_URL
+        if os.environ.get("PYTEST_VERSION"):
+            return "sqlite+aiosqlite:///./test_db.db"
+        return (f'postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:'
+                f'{self.POSTGRES_PORT}/{self.POSTGRES_DB}')
+
 
 settings = Settings()
@@ -0,0 +1,112 @@
+from abc import ABC
+
+from sqlalchemy import delete, func, select, update, Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from db.engine import get_async_session_factory
+from db.models import Location, User
+from utilites.cache import user_cache
+from utilites.exceptions import SameLocationException
+from users.schemas import LocationCheckUser, UserInDB
+
+
+class AsyncAbstractDao(ABC):
+
+    def __init__(self, model, session_factory: async_sessionmaker | None = None):
+        self._session_factory = session_factory or get_async_session_factory()
+        self._model = model
+
+    async def get_one(self, *args, **kwargs):
+        ...
+
+    async def get_all(self, *args, **kwargs):
+        ...
+
+    async def save_one(self, *args, **kwargs):
+        ...
+
+    async def delete_one(self, *args, **kwargs):
+        ...
+
+
+class AsyncUserDao(AsyncAbstractDao):
+
+    async def get_one(self, login: str) -> Row[tuple[User]] | None:
+        async with self._session_factory() as session:
+            user = await session.scalar(select(self._model).filter(self._model.login == login).limit(1))
+        return user
+
+    async def save_one(self, login: str, hashed_password: str) -> Row[tuple[User]] | None:
+        async with self._session_factory() as session:
+            new_user = self._model(login=login, password=hashed_password)
+            session.add(new_user)
+            await session.commit()
+            await session.refresh(new_user)
+        await user_cache.delete(login)
+        return new_user
+
+    async def update_password(self, login: str, hashed_password: str) -> None:
+        async with self._session_factory() as session:
+            await session.execute(update(self._model).filter(self._model.login == login)
+                                  .values(password=hashed_password))
+            await session.commit()
+        await user_cache.delete(login)
+
+
+class AsyncLocationDao(AsyncAbstractDao):
+
+    async def get_one(self, name: str) -> Row[tuple[Location]] | None:
+        async with self._session_factory() as session:
+            location = await session.scalar(select(self._model).filter(self._model.name == name).limit(1))
+        return location
+
+    async def get_all(self, user: UserInDB | Row[tuple[User]]) -> list:
+        async with self._session_factory() as session:
+            user_locations = await session.scalars(select(self._model).filter(self._model.user_id == user.id)
+                                                   .order_by(self._model.id))
+            return list(user_locations)
+
+    async def get_page(self, user: UserInDB | Row[tuple[User]], limit: int, offset: int) -> list:
+        async with self._session_factory() as session:
+            user_locations = await session.scalars(select(self._model).filter(self._model.user_id == user.id)
+                                                   .order_by(self._model.id).limit(limit).offset(offset))
+            return list(user_locations)
+
+    async def count(self, user: UserInDB | Row[tuple[User]]) -> int:
+        async with self._session_factory() as session:
+            return await session.scalar(select(func.count(self._model.id)).filter(self._model.user_id == user.id))
+
+    async def get_distinct_coordinates(self) -> list:
+        async with self._session_factory() as session:
+            coordinates = await session.execute(select(self._model.latitude, self._model.longitude).distinct())
+            return list(coordinates.all())
+
+    async def save_one(self, location_for_db: LocationCheckUser) -> LocationCheckUser:
+        async with self._session_factory() as session:
+            new_location_dict = location_for_db.model_dump()
+            new_location = self._model(**new_location_dict)
+            session.add(new_location)
+            try:
+                await session.commit()
+            except IntegrityError:
+                raise SameLocationException
+            await session.refresh(new_location)
+        return new_location
+
+    async def set_city_ids(self, city_ids: dict[int, int]) -> None:
+        # Пакетный UPDATE по первичному ключу: {location_id: city_id}
+        if not city_ids:
+            return
+        async with self._session_factory() as session:
+            await session.execute(update(self._model), [{"id": location_id, "city_id": city_id}
+                                                        for location_id, city_id in city_ids.items()])
+            await session.commit()
+
+    async def delete_one(self, location_id: int, user_id: int) -> str:
+        # Удаляется только локация владельца: чужой id дает "Не найдено"
+        async with self._session_factory() as session:
+            result = await session.execute(delete(self._model).filter(self._model.id == location_id,
+                                                                      self._model.user_id == user_id))
+            await session.commit()
+            return "Удалено" if result.rowcount else "Не найдено"
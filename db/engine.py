@@ -0,0 +1,86 @@
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+
+from config import settings
+from monitoring.metrics import DB_POOL_CHECKOUT_WAIT
+
+_async_engine: AsyncEngine | None = None
+_async_session_factory: async_sessionmaker | None = None
+_pool_counters = {"connects": 0, "checkouts": 0, "checkins": 0}
+
+
+def _count(name: str):
+    def listener(*args):
+        _pool_counters[name] += 1
+    return listener
+
+
+class _TimedCheckoutMixin:
+    # Время ожидания свободного соединения (или открытия нового) при выдаче из пула
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def create_async_db_engine() -> AsyncEngine:
+    if settings.ASYNC_DB_URL.startswith("sqlite"):
+        # Соединения aiosqlite привязаны к event loop, пул для файла SQLite не нужен
+        return create_async_engine(url=settings.ASYNC_DB_URL, echo=False, poolclass=NullPool)
+    engine = create_async_engine(
+        url=settings.ASYNC_DB_URL,
+        echo=False,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    for name, counter in (("connect", "connects"), ("checkout", "checkouts"), ("checkin", "checkins")):
+        event.listen(engine.sync_engine, name, _count(counter))
+    return engine
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        _async_engine = create_async_db_engine()
+    return _async_engine
+
+
+def get_async_session_factory() -> async_sessionmaker:
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(bind=get_async_engine(), autoflush=False,
+                                                    expire_on_commit=False)
+    return _async_session_factory
+
+
+def init_db() -> AsyncEngine:
+    return get_async_engine()
+
+
+async def dispose_db() -> None:
+    global _async_engine, _async_session_factory
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine, _async_session_factory = None, None
+
+
+def pool_stats() -> dict:
+    stats = dict(_pool_counters)
+    pool = _async_engine.pool if _async_engine is not None else None
+    if pool is not None and hasattr(pool, "checkedout"):
+        stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                     checked_out=pool.checkedout(), overflow=pool.overflow())
+    return stats
@@ -5,6 +5,7 @@ from sqlalchemy import pool
 
 from alembic import context
 
+from config import settings
 from db.models import *
 
 # this is the Alembic Config object, which provides
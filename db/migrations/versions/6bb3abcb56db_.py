@@ -1,4 +1,4 @@
-"""empty message
+"""initial schema: user and location
 
 Revision ID: 6bb3abcb56db
 Revises: 
@@ -19,12 +19,26 @@ depends_on: Union[str, Sequence[str], None] = None
 
 
 def upgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    # Уникальность login, country/state и ограничения location добавляют следующие ревизии
+    op.create_table(
+        'user',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('login', sa.String(), nullable=False),
+        sa.Column('password', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_table(
+        'location',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('latitude', sa.Numeric(), nullable=False),
+        sa.Column('longitude', sa.Numeric(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
 
 
 def downgrade() -> None:
-    # ### commands auto generated by Alembic - please adjust! ###
-    pass
-    # ### end Alembic commands ###
+    op.drop_table('location')
+    op.drop_table('user')
@@ -0,0 +1,26 @@
+"""location index for per-user lookups
+
+Revision ID: 8d41c2b7e9a3
+Revises: 2e0718079933
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41c2b7e9a3'
+down_revision: Union[str, None] = '2e0718079933'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_location_user_id_id', 'location', ['user_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_location_user_id_id', table_name='location')
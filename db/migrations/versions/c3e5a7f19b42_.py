@@ -0,0 +1,26 @@
+"""location.city_id for batched OpenWeather requests
+
+Revision ID: c3e5a7f19b42
+Revises: 8d41c2b7e9a3
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7f19b42'
+down_revision: Union[str, None] = '8d41c2b7e9a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('location', sa.Column('city_id', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('location', 'city_id')
@@ -1,18 +1,14 @@
 from decimal import Decimal
 from typing import Annotated
 
-from sqlalchemy import ForeignKey, create_engine, UniqueConstraint
+from sqlalchemy import ForeignKey, Index, UniqueConstraint
+from sqlalchemy.ext.asyncio import AsyncEngine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
-from config import settings
+from db.engine import get_async_engine
 
 intpk = Annotated[int, mapped_column(primary_key=True, autoincrement=True)]
 
-engine = create_engine(
-    url=settings.DB_URL,
-    echo=False
-)
-
 
 class Base(DeclarativeBase):
     pass
@@ -36,10 +32,16 @@ class Location(Base):
     longitude: Mapped[Decimal]
     country: Mapped[str]
     state: Mapped[str]
+    # id города OpenWeather: заполняется после первого запроса погоды, нужен для пакетных запросов /group
+    city_id: Mapped[int | None]
 
     __table_args__ = (
         UniqueConstraint('name', 'latitude', 'longitude', 'user_id', name='name_user_uc'),
+        # Локации пользователя постранично: WHERE user_id = ? ORDER BY id (в т.ч. keyset по id)
+        Index('ix_location_user_id_id', 'user_id', 'id'),
     )
 
 
-Base.metadata.create_all(engine)
+async def create_schema(engine: AsyncEngine | None = None) -> None:
+    async with (engine or get_async_engine()).begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
@@ -1,11 +1,11 @@
 from pydantic import BaseModel
 
-from db.sessions import UserDao, LocationDao
+from db.async_sessions import AsyncUserDao, AsyncLocationDao
 
 
 class TwoDaoHelper(BaseModel):
-    user: UserDao
-    location: LocationDao
+    user: AsyncUserDao
+    location: AsyncLocationDao
 
     class Config:
         arbitrary_types_allowed = True
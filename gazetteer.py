@@ -0,0 +1,158 @@
+# Локальный справочник городов: отсортированный массив нормализованных названий и поиск по префиксу (bisect).
+# Заполняется из дампа GeoNames (cities500.txt и т.п.) и ответами geo API, которые уже были получены.
+
+import re
+import unicodedata
+from bisect import bisect_left
+from itertools import chain
+
+from transliterate import translit
+
+from config import settings
+
+# В индекс попадают только названия на латинице и кириллице
+NAME_RE = re.compile(r"^[\w\s\-'’.()]+$")
+NOT_NAME_LETTERS_RE = re.compile(r"[^\W\d_A-Za-zÀ-ɏЀ-ӿ]")
+CYRILLIC_RE = re.compile(r"[Ѐ-ӿ]")
+
+
+def normalize_name(name: str) -> str:
+    # "Сан-Паулу", "сан паулу" и "San Paulu" дают один ключ; "São" и "Sao" тоже
+    name = " ".join(name.replace("-", " ").split()).casefold()
+    if name.isascii():
+        return name
+    if CYRILLIC_RE.search(name):
+        name = translit(name, language_code="ru", reversed=True).casefold()
+    return "".join(char for char in unicodedata.normalize("NFKD", name) if not unicodedata.combining(char))
+
+
+def is_indexed_name(name: str) -> bool:
+    return bool(name) and bool(NAME_RE.match(name)) and not NOT_NAME_LETTERS_RE.search(name)
+
+
+class Gazetteer:
+    """Отсортированные ключи _keys и параллельный список номеров мест _place_ids.
+
+    Места из ответов geo API добавляются в отдельный небольшой индекс _learned_keys/_learned_place_ids:
+    вставка в большой индекс из дампа сдвигала бы миллионы элементов в цикле событий. Индекс выученных мест
+    ограничен learn_max_keys ключами, сверх этого новые места не запоминаются.
+    """
+
+    def __init__(self, scan_limit: int = 200, learn_max_keys: int = 50_000):
+        self.scan_limit = scan_limit
+        self.learn_max_keys = learn_max_keys
+        self.clear()
+
+    def clear(self) -> None:
+        self._keys: list[str] = []
+        self._place_ids: list[int] = []
+        self._learned_keys: list[str] = []
+        self._learned_place_ids: list[int] = []
+        self._places: list[dict] = []
+        self._population: list[int] = []
+        self._coordinates: dict[tuple[float, float], int] = {}
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def _new_place(self, location: dict, population: int) -> int | None:
+        coordinates = (round(float(location["lat"]), 4), round(float(location["lon"]), 4))
+        if coordinates in self._coordinates:
+            return None
+        place_id = len(self._places)
+        self._coordinates[coordinates] = place_id
+        self._places.append(location)
+        self._population.append(population)
+        return place_id
+
+    def add(self, location: dict, names: list[str], population: int = 0) -> None:
+        keys = {normalize_name(name) for name in names if is_indexed_name(name)}
+        if len(self._learned_keys) + len(keys) > self.learn_max_keys:
+            return
+        place_id = self._new_place(location, population)
+        if place_id is None:
+            return
+        for key in keys:
+            position = bisect_left(self._learned_keys, key)
+            self._learned_keys.insert(position, key)
+            self._learned_place_ids.insert(position, place_id)
+
+    def add_geocode_results(self, deserialized_locations: list) -> None:
+        # Ответ geo API: отображаемое имя - русское, если есть, ключи - все local_names
+        for location in deserialized_locations:
+            local_names = location.get("local_names", {})
+            self.add({"name": local_names.get("ru", location["name"]), "lat": location["lat"],
+                      "lon": location["lon"], "country": location["country"],
+                      "state": location.get("state") or "-"},
+                     [location["name"], *local_names.values()])
+
+    def load_geonames(self, path: str, min_population: int = 0) -> int:
+        # Формат дампа: https://download.geonames.org/export/dump/readme.txt
+        # Массивы строятся целиком и сортируются один раз, без вставок по одной
+        keys = list(zip(self._keys, self._place_ids))
+        loaded = 0
+        with open(path, encoding="utf-8") as dump:
+            for line in dump:
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) < 15 or columns[6] != "P":
+                    continue
+                population = int(columns[14] or 0)
+                if population < min_population:
+                    continue
+                alternate_names = [name for name in columns[3].split(",") if is_indexed_name(name)]
+                display_name = next((name for name in alternate_names if CYRILLIC_RE.search(name)), columns[1])
+                place_id = self._new_place({"name": display_name, "lat": columns[4], "lon": columns[5],
+                                            "country": columns[8], "state": "-"}, population)
+                if place_id is None:
+                    continue
+                names = {normalize_name(name) for name in {columns[1], columns[2], *alternate_names}
+                         if is_indexed_name(name)}
+                keys.extend((key, place_id) for key in names)
+                loaded += 1
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._place_ids = [place_id for _, place_id in keys]
+        return loaded
+
+    @staticmethod
+    def _matching(keys: list[str], place_ids: list[int], key: str, exact: bool):
+        position = bisect_left(keys, key)
+        while position < len(keys):
+            current = keys[position]
+            if (current != key) if exact else not current.startswith(key):
+                return
+            yield place_ids[position]
+            position += 1
+
+    def _scan(self, key: str, exact: bool) -> list[int]:
+        place_ids = {}
+        for place_id in chain(self._matching(self._keys, self._place_ids, key, exact),
+                              self._matching(self._learned_keys, self._learned_place_ids, key, exact)):
+            place_ids.setdefault(place_id)
+            if len(place_ids) >= self.scan_limit:
+                break
+        return list(place_ids)
+
+    def _result(self, place_ids: list[int], limit: int) -> list[dict]:
+        place_ids.sort(key=lambda place_id: -self._population[place_id])
+        return [self._places[place_id] for place_id in place_ids[:limit]]
+
+    def autocomplete(self, prefix: str, limit: int = 10) -> list[dict]:
+        key = normalize_name(prefix) if prefix else ""
+        if not key:
+            return []
+        return self._result(self._scan(key, exact=False), limit)
+
+    def lookup(self, city: str, limit: int = 5) -> list[dict]:
+        # Точное совпадение названия; пустой список - промах, нужно идти в geo API
+        key = normalize_name(city)
+        return self._result(self._scan(key, exact=True), limit) if key else []
+
+
+gazetteer = Gazetteer(learn_max_keys=settings.GAZETTEER_LEARN_MAX_KEYS)
+
+
+def load_gazetteer() -> int:
+    if not settings.GAZETTEER_PATH:
+        return 0
+    return gazetteer.load_geonames(settings.GAZETTEER_PATH, min_population=settings.GAZETTEER_MIN_POPULATION)
@@ -0,0 +1,43 @@
+# Продакшен-запуск: gunicorn с воркерами uvicorn, по одному на доступное ядро.
+# Запуск: gunicorn main:app (конфиг подхватывается из текущего каталога)
+
+import os
+import shutil
+
+workers = int(os.environ.get("WEB_CONCURRENCY") or len(os.sched_getaffinity(0)))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8001')}"
+
+# Приложение импортируется один раз в мастере, воркеры получают его через fork и готовы сразу.
+# Это безопасно: при импорте не открываются соединения с БД и Redis, не создаются потоки и клиенты,
+# все это делает lifespan в каждом воркере
+preload_app = True
+
+# Воркер перезапускается после max_requests запросов (с разбросом, чтобы не все сразу) - защита от утечек памяти.
+# При перезапуске и SIGHUP текущие запросы дорабатываются до graceful_timeout секунд
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = max_requests // 10
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+# Heartbeat воркеров в памяти, а не на overlay-диске контейнера
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS", "*")
+accesslog = None
+
+# Переменные читаются настройками приложения при preload, поэтому задаются до его импорта
+os.environ["WEB_CONCURRENCY"] = str(workers)
+if workers > 1:
+    # Один запрос к API на ключ кэша во всех воркерах, а не в каждом
+    os.environ.setdefault("SINGLE_FLIGHT_REDIS_LOCK", "true")
+# Счетчики и гистограммы Prometheus каждого воркера пишутся в файлы и суммируются на /metrics.
+# Каталог очищается до preload: метрики создаются уже при импорте приложения
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/weather-prometheus")
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,71 @@
+import orjson
+from fastapi import APIRouter, Request, Depends, HTTPException, Query, status
+from fastapi.responses import ORJSONResponse
+from fastapi_pagination import Page
+from starlette.responses import Response
+
+from db.async_sessions import AsyncAbstractDao
+from db.two_dao_shema import TwoDaoHelper
+from config import settings
+from gazetteer import gazetteer
+from users.authorization.jwt_token import get_token
+from users.authorization.passwords import get_current_user
+from locations.location_service import LocationService
+from users.schemas import UserInDB, LocationCheck, SavedLocation, WeatherCheck
+from utilites.conditional import (PRIVATE_REVALIDATE, cache_headers, compute_etag, is_not_modified,
+                                  not_modified_response)
+from utilites.depends import get_weather_service, get_async_location_dao, get_location_service, get_two_dao
+from weather_service import WeatherApiService
+
+api_router = APIRouter(prefix="/api/v1", default_response_class=ORJSONResponse)
+
+
+def etag_response(request: Request, content, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    # ETag - хэш тела ответа; при совпадении с If-None-Match тело не отправляется
+    body = orjson.dumps(content)
+    etag = compute_etag(body)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, cache_control)
+    return Response(body, media_type="application/json", headers=cache_headers(etag, cache_control))
+
+
+@api_router.get("/locations", response_model=Page[WeatherCheck], dependencies=[Depends(get_current_user)])
+async def list_locations(request: Request, page: int = 1,
+                         two_dao: TwoDaoHelper = Depends(get_two_dao),
+                         weather_service: WeatherApiService = Depends(get_weather_service),
+                         location_service: LocationService = Depends(get_location_service)):
+    paginated_user_locations = await location_service.get_result_locations(page, get_token(request),
+                                                                           two_dao, weather_service)
+    return etag_response(request, paginated_user_locations.model_dump(mode="json"))
+
+
+@api_router.get("/geocode", response_model=list[LocationCheck], dependencies=[Depends(get_current_user)])
+async def geocode(request: Request, city: str = None,
+                  weather_service: WeatherApiService = Depends(get_weather_service)):
+    locations = await weather_service.find_locations_by_name(city=city)
+    return etag_response(request, [location.model_dump(mode="json") for location in locations],
+                         cache_control="private, max-age=3600")
+
+
+@api_router.get("/autocomplete", response_model=list[LocationCheck], dependencies=[Depends(get_current_user)])
+async def autocomplete(request: Request, q: str = "", limit: int = Query(settings.AUTOCOMPLETE_LIMIT, ge=1, le=50)):
+    # Только локальный справочник, без обращения к geo API
+    locations = [LocationCheck(**place).model_dump(mode="json") for place in gazetteer.autocomplete(q, limit)]
+    return etag_response(request, locations, cache_control="private, max-age=3600")
+
+
+@api_router.post("/locations", response_model=SavedLocation, status_code=status.HTTP_201_CREATED)
+async def add_location(data: LocationCheck, current_user: UserInDB = Depends(get_current_user),
+                       location_service: LocationService = Depends(get_location_service),
+                       dao: AsyncAbstractDao = Depends(get_async_location_dao)):
+    location = await dao.save_one(location_service.get_location_db(data, current_user))
+    return ORJSONResponse(SavedLocation.model_validate(location).model_dump(mode="json"),
+                          status_code=status.HTTP_201_CREATED)
+
+
+@api_router.delete("/locations/{location_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_location(location_id: int, current_user: UserInDB = Depends(get_current_user),
+                          dao: AsyncAbstractDao = Depends(get_async_location_dao)):
+    if await dao.delete_one(location_id, user_id=current_user.id) != "Удалено":
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Локация не найдена")
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,5 +1,5 @@
 from config import settings
-from fastapi_pagination import paginate, Page, Params
+from fastapi_pagination import create_page, Page, Params
 
 from db.two_dao_shema import TwoDaoHelper
 from users.authorization import passwords as user_funcs
@@ -10,14 +10,18 @@ from weather_service import WeatherApiService
 class LocationService:
 
     @staticmethod
-    def get_result_locations(page: int, token: str, two_dao: TwoDaoHelper,
-                             weather_service: WeatherApiService) -> Page[WeatherCheck]:
+    async def get_result_locations(page: int, token: str, two_dao: TwoDaoHelper,
+                                   weather_service: WeatherApiService) -> Page[WeatherCheck]:
         if token:
-            current_user = user_funcs.get_current_user(token, two_dao.user)
-            user_locations = two_dao.location.get_all(current_user)
-            saved_locations = weather_service.get_user_locations_with_weather(user_locations=user_locations)
-            paginated_user_locations = paginate(saved_locations, Params(page=page, size=settings.PAGE_SIZE))
-            return paginated_user_locations
+            current_user = await user_funcs.get_current_user(token, two_dao.user)
+            params = Params(page=page, size=settings.PAGE_SIZE)
+            raw_params = params.to_raw_params().as_limit_offset()
+            # Погода запрашивается только для локаций текущей страницы
+            total = await two_dao.location.count(current_user)
+            user_locations = await two_dao.location.get_page(current_user, raw_params.limit, raw_params.offset)
+            saved_locations = await weather_service.get_user_locations_with_weather(
+                user_locations=user_locations, location_dao=two_dao.location)
+            return create_page(saved_locations, total=total, params=params)
 
     @staticmethod
     def get_location_db(data: LocationCheck, current_user: UserInDB) -> LocationCheckUser:
@@ -1,74 +1,97 @@
 from typing import Annotated
 from fastapi import APIRouter, Request, Form, Depends, status
-from fastapi_cache.decorator import cache
 from loguru import logger
 
 from starlette.responses import RedirectResponse, HTMLResponse
 
 from db.two_dao_shema import TwoDaoHelper
-from templates.create_jinja import templates
+from templates.create_jinja import templates, templates_version
 from users.authorization.jwt_token import get_token
 from users.authorization.passwords import get_current_user
-from db.sessions import AbstractDao
-from utilites.depends import get_weather_service, get_location_dao, get_location_service, get_two_dao
+from db.async_sessions import AsyncAbstractDao
+from utilites.depends import get_weather_service, get_async_location_dao, get_location_service, get_two_dao
 from locations.location_service import LocationService
+from utilites.conditional import cache_headers, compute_data_etag, is_not_modified, not_modified_response
 from utilites.exceptions import SameLocationException
 from fastapi_pagination import Page
 from users.schemas import UserInDB, LocationCheck, WeatherCheck
 from weather_service import WeatherApiService
-from utilites.utils import ORHTMLCoder, custom_key_builder
 
 
 location_router = APIRouter()
 
 
 @location_router.get('/', response_model=Page[WeatherCheck], response_class=HTMLResponse)
-def get_main_page(request: Request, current_page: int = None,  page: int = 1,
-                  two_dao: TwoDaoHelper = Depends(get_two_dao),
-                  weather_service: WeatherApiService = Depends(get_weather_service),
-                  location_service: LocationService = Depends(get_location_service)):
+async def get_main_page(request: Request, current_page: int = None,  page: int = 1,
+                        two_dao: TwoDaoHelper = Depends(get_two_dao),
+                        weather_service: WeatherApiService = Depends(get_weather_service),
+                        location_service: LocationService = Depends(get_location_service)):
     current_page = current_page if current_page else page
-    paginated_user_locations = location_service.get_result_locations(page, get_token(request),
-                                                                     two_dao, weather_service)
+    token = get_token(request)
+    paginated_user_locations = await location_service.get_result_locations(page, token, two_dao, weather_service)
+    error = request.cookies.get('error_message')
+    # ETag по набору локаций и времени показаний: если ничего не изменилось, страница не рендерится
+    etag = compute_data_etag(templates_version, "index", current_page, bool(token), request.cookies.get('username'),
+                             page_etag_data(paginated_user_locations))
+    if not error and is_not_modified(request, etag):
+        return not_modified_response(etag)
     response = templates.TemplateResponse(name='index.html',
                                           context={'request': request, 'current_page': current_page,
                                                    'saved_locations': paginated_user_locations,
-                                                   "error": request.cookies.get('error_message')})
+                                                   "error": error},
+                                          headers=cache_headers(etag))
     response.delete_cookie(key="error_message")
     return response
 
 
+def page_etag_data(paginated_user_locations: Page[WeatherCheck] | None) -> list | None:
+    if paginated_user_locations is None:
+        return None
+    # Возраст устаревшего показания учитывается с точностью до минуты, как и на странице
+    return [paginated_user_locations.total, paginated_user_locations.page,
+            [(location.location_id, location.name, location.dt,
+              None if location.stale_age is None else location.stale_age // 60)
+             for location in paginated_user_locations.items]]
+
+
 @location_router.get('/locations', dependencies=[Depends(get_current_user)])
-@cache(expire=180, coder=ORHTMLCoder, key_builder=custom_key_builder)
 async def get_locations_page(request: Request, city: str = None,
                              weather_service: WeatherApiService = Depends(get_weather_service)):
-    locations = weather_service.find_locations_by_name(city=city)
+    locations = await weather_service.find_locations_by_name(city=city)
+    etag = compute_data_etag(templates_version, "locations", request.cookies.get('username'),
+                             [location.model_dump(mode="json") for location in locations])
+    if not request.cookies.get('error_message') and is_not_modified(request, etag):
+        return not_modified_response(etag)
     response = templates.TemplateResponse(name='locations.html',
-                                          context={'request': request, 'locations': locations})
+                                          context={'request': request, 'locations': locations},
+                                          headers=cache_headers(etag))
     response.delete_cookie(key="error_message")
     return response
 
 
-@location_router.post('/delete_location', dependencies=[Depends(get_current_user)])
+@location_router.post('/delete_location')
 async def delete_locations(request: Request, location_id: Annotated[int, Form()],
                            location_name: Annotated[str, Form()], current_page: Annotated[int, Form()],
-                           dao: AbstractDao = Depends(get_location_dao)):
-    if dao.delete_one(location_id) == "Удалено":
-        logger.info(f"Пользователь {request.cookies.get('username')} удалил локацию {location_name}")
-        redirect_url = f"/?current_page={current_page}"
-        return RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
+                           current_user: UserInDB = Depends(get_current_user),
+                           dao: AsyncAbstractDao = Depends(get_async_location_dao)):
+    if await dao.delete_one(location_id, user_id=current_user.id) == "Удалено":
+        logger.info("Пользователь {username} удалил локацию {location}", username=request.cookies.get("username"),
+                    location=location_name)
+    redirect_url = f"/?current_page={current_page}"
+    return RedirectResponse(redirect_url, status_code=status.HTTP_303_SEE_OTHER)
 
 
-@location_router.post("/add_location", dependencies=[Depends(get_current_user)])
-def add_location_for_user_in_db(request: Request, data: Annotated[LocationCheck, Form()],
-                                current_user: UserInDB = Depends(get_current_user),
-                                location_service: LocationService = Depends(get_location_service),
-                                dao: AbstractDao = Depends(get_location_dao),
-                                response=RedirectResponse('/', status_code=status.HTTP_303_SEE_OTHER)):
+@location_router.post("/add_location")
+async def add_location_for_user_in_db(request: Request, data: Annotated[LocationCheck, Form()],
+                                      current_user: UserInDB = Depends(get_current_user),
+                                      location_service: LocationService = Depends(get_location_service),
+                                      dao: AsyncAbstractDao = Depends(get_async_location_dao),
+                                      response=RedirectResponse('/', status_code=status.HTTP_303_SEE_OTHER)):
     location_for_db = location_service.get_location_db(data, current_user)
     try:
-        location = dao.save_one(location_for_db)
-        logger.info(f"Пользователь {request.cookies.get('username')} сохранил локацию {location.name}")
+        location = await dao.save_one(location_for_db)
+        logger.info("Пользователь {username} сохранил локацию {location}", username=request.cookies.get("username"),
+                    location=location.name)
     except SameLocationException as e:
         response.set_cookie(key="error_message", value=e.detail, httponly=True)
     return response
@@ -1,3 +1,7 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import anyio
 from fastapi import FastAPI
 from fastapi import Request
 from loguru import logger
@@ -5,22 +9,71 @@ from pydantic import ValidationError
 from starlette import status
 from starlette.middleware.cors import CORSMiddleware
 
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
 from fastapi.exceptions import HTTPException
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse
 from starlette.responses import RedirectResponse
 from fastapi_pagination import add_pagination
-from redis import asyncio as aioredis
 
 from config import settings
+from db.engine import init_db, dispose_db
+from db.models import create_schema
+from gazetteer import load_gazetteer
 from locations.router import location_router, templates
+from locations.api_router import api_router
+from monitoring.logs import RequestContextMiddleware, setup_logging, shutdown_logging
+from monitoring.metrics import MetricsMiddleware
+from monitoring.router import monitoring_router
 from users.router import user_router
+from users.authorization.hashing import hashing_pool
+from utilites.cache import create_cache_redis, set_cache_redis
+from utilites.compression import CompressionMiddleware
 from utilites.exceptions import OpenWeatherApiException, TokenExpiredException
-
-app = FastAPI()
-
-logger.add("logs/{time:DD-MM-YYYY}.log", rotation="1 MB")
+from utilites.depends import get_async_location_dao, get_weather_service
+from utilites.http_client import init_http_client, close_http_client
+from utilites.static_assets import create_static_files
+from weather_prefetch import WeatherPrefetcher
+
+
+async def startup(app: FastAPI) -> None:
+    setup_logging()
+    redis = create_cache_redis()
+    set_cache_redis(redis)
+    # Движки создаются без подключения к БД; схему готовят миграции alembic до запуска воркеров
+    init_db()
+    if settings.DB_CREATE_SCHEMA:
+        await create_schema()
+    loaded = await anyio.to_thread.run_sync(load_gazetteer)
+    if loaded:
+        logger.info("Справочник городов: загружено {loaded} мест из {path}", loaded=loaded,
+                    path=settings.GAZETTEER_PATH)
+    # Клиент OpenWeather создается до приема запросов: его получают синхронно прямо в цикле событий
+    await init_http_client()
+    if settings.WEATHER_PREFETCH_ENABLED:
+        prefetcher = WeatherPrefetcher(get_weather_service(), get_async_location_dao())
+        app.state.prefetch_task = asyncio.create_task(prefetcher.run_forever())
+
+
+async def shutdown(app: FastAPI) -> None:
+    if getattr(app.state, "prefetch_task", None):
+        # Задача освобождает аренду при отмене, поэтому ее дожидаемся до закрытия соединений
+        app.state.prefetch_task.cancel()
+        await asyncio.gather(app.state.prefetch_task, return_exceptions=True)
+    await close_http_client()
+    await dispose_db()
+    hashing_pool.shutdown()
+    shutdown_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup(app)
+    try:
+        yield
+    finally:
+        await shutdown(app)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -29,44 +82,71 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_SIZE,
+                       gzip_level=settings.COMPRESSION_GZIP_LEVEL, brotli_quality=settings.COMPRESSION_BROTLI_QUALITY)
+app.add_middleware(MetricsMiddleware)
+if settings.PROFILING_ENABLED:
+    from monitoring.profiling import ProfilingMiddleware
+
+    app.add_middleware(ProfilingMiddleware, directory=settings.PROFILING_DIR, token=settings.PROFILING_TOKEN,
+                       sample_rate=settings.PROFILING_SAMPLE_RATE,
+                       max_disk_bytes=settings.PROFILING_MAX_DISK_MB * 1024 * 1024)
+app.add_middleware(RequestContextMiddleware, slow_ms=settings.LOG_SLOW_REQUEST_MS)
 app.include_router(user_router)
 app.include_router(location_router)
+app.include_router(api_router)
+app.include_router(monitoring_router)
 
 add_pagination(app)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", create_static_files(), name="static")
+
+
+def is_api_request(request: Request) -> bool:
+    return request.url.path.startswith(api_router.prefix)
 
 
-@app.on_event("startup")
-async def startup():
-    redis = aioredis.from_url(f"redis://{settings.POSTGRES_HOST}", encoding="utf8", decode_responses=True)
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+def api_error_response(status_code: int, detail) -> ORJSONResponse:
+    return ORJSONResponse({"detail": detail}, status_code=status_code)
 
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc: HTTPException):
-    logger.error(f"Запрос: {request.method} {request.url} - ошибка {exc.detail}")
+    logger.error("Запрос: {method} {url} - ошибка {detail}", method=request.method, url=str(request.url),
+                 detail=exc.detail)
+    if is_api_request(request):
+        return api_error_response(exc.status_code, exc.detail)
     return templates.TemplateResponse(name='error.html',
                                       context={'request': request, "error": exc.detail})
 
 
 @app.exception_handler(ValidationError)
 async def validation_exception_handler(request: Request, exc: ValidationError):
-    logger.error(f"Запрос: {request.method} {request.url} - ошибка {str(exc)}")
+    logger.error("Запрос: {method} {url} - ошибка {detail}", method=request.method, url=str(request.url),
+                 detail=str(exc))
+    if is_api_request(request):
+        return api_error_response(status.HTTP_422_UNPROCESSABLE_ENTITY, exc.errors(include_url=False))
     return templates.TemplateResponse(name='error.html',
                                       context={'request': request, "error": str(exc)})
 
 
 @app.exception_handler(OpenWeatherApiException)
 def open_weather_api_exception_handler(request: Request, exc: OpenWeatherApiException):
-    logger.error(f"Запрос: {request.method} {request.url} - ошибка {exc.detail}")
+    logger.error("Запрос: {method} {url} - ошибка {detail}", method=request.method, url=str(request.url),
+                 detail=exc.detail)
+    if is_api_request(request):
+        return api_error_response(exc.status_code, exc.detail)
     return templates.TemplateResponse(name='error.html',
                                       context={'request': request, "error": exc.detail})
 
 
 @app.exception_handler(TokenExpiredException)
 def token_expired_exception_handler(request: Request, exc: TokenExpiredException):
-    logger.error(f"Запрос: {request.method} {request.url} - ошибка {exc.detail}")
+    logger.error("Запрос: {method} {url} - ошибка {detail}", method=request.method, url=str(request.url),
+                 detail=exc.detail)
+    if is_api_request(request):
+        return api_error_response(status.HTTP_401_UNAUTHORIZED, exc.detail)
     response = RedirectResponse('/authorization', status_code=status.HTTP_303_SEE_OTHER)
     response.set_cookie(key="error_message", value=exc.detail, httponly=True)
     response.delete_cookie(key="user_access_token")
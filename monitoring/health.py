@@ -0,0 +1,73 @@
+# Проверки готовности воркера: Postgres, Redis и состояние предохранителя OpenWeather
+
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from config import settings
+from db.engine import get_async_engine
+from utilites.cache import get_cache_redis
+from utilites.resilience import openweather_breaker
+
+
+async def timed_check(check) -> dict:
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(settings.HEALTH_CHECK_TIMEOUT):
+            await check()
+    except Exception as e:
+        return {"ok": False, "error": type(e).__name__}
+    return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+async def check_postgres() -> dict:
+    async def select_one():
+        async with get_async_engine().connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    return await timed_check(select_one)
+
+
+async def check_redis() -> dict:
+    redis = get_cache_redis()
+    if redis is None:
+        return {"ok": True, "enabled": False}
+    return await timed_check(redis.ping)
+
+
+def check_openweather() -> dict:
+    breaker = openweather_breaker.stats()
+    return {"ok": breaker["state"] != openweather_breaker.OPEN, "circuit": breaker["state"]}
+
+
+class ReadinessProbe:
+    """Без БД воркер не готов (503). Без Redis или при открытом предохранителе он работает
+    с локальными кэшами и сохраненной погодой, поэтому статус degraded с кодом 200.
+
+    Результат кэшируется на ttl секунд, чтобы частые пробы не нагружали БД и Redis.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.reset()
+
+    def reset(self) -> None:
+        self._result: dict | None = None
+        self._checked_at = 0.0
+
+    async def check(self) -> dict:
+        if self._result is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self._result
+        postgres, redis = await asyncio.gather(check_postgres(), check_redis())
+        openweather = check_openweather()
+        if not postgres["ok"]:
+            state = "unavailable"
+        else:
+            state = "ok" if redis["ok"] and openweather["ok"] else "degraded"
+        self._result = {"status": state, "checks": {"postgres": postgres, "redis": redis, "openweather": openweather}}
+        self._checked_at = time.monotonic()
+        return self._result
+
+
+readiness_probe = ReadinessProbe(ttl=settings.HEALTH_CHECK_CACHE_SECONDS)
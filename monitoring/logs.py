@@ -0,0 +1,245 @@
+# Структурные логи: JSON-строки пишутся в файл отдельным потоком через ограниченную очередь,
+# request id, пользователь, маршрут и тайминги вызовов OpenWeather берутся из контекста запроса.
+
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from pathlib import Path
+from uuid import uuid4
+
+import orjson
+from loguru import logger
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from config import settings
+
+WARNING_LEVEL = logger.level("WARNING").no
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_RE = re.compile(r"^[\w\-.]{1,64}$")
+
+# Словарь общий для всего запроса: зависимости в threadpool получают копию контекста, но тот же словарь
+request_context: ContextVar[dict | None] = ContextVar("request_context", default=None)
+
+
+def bind_request(**fields) -> None:
+    context = request_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+def record_upstream(endpoint: str, seconds: float) -> None:
+    context = request_context.get()
+    if context is not None:
+        context["upstream"].append((endpoint, seconds))
+
+
+def add_request_context(record: dict) -> None:
+    context = request_context.get()
+    if context is not None:
+        for key in ("request_id", "user", "route"):
+            if key in context:
+                record["extra"].setdefault(key, context[key])
+
+
+def should_log(record: dict, sample_rate: float) -> bool:
+    # Семплируются только записи, помеченные sampled=True; предупреждения и ошибки пишутся всегда
+    if not record["extra"].get("sampled") or record["level"].no >= WARNING_LEVEL:
+        return True
+    return random.random() < sample_rate
+
+
+def serialize_record(record: dict) -> bytes:
+    data = {"time": record["time"].isoformat(), "level": record["level"].name, "message": record["message"],
+            "module": record["name"], "function": record["function"], "line": record["line"]}
+    data.update((key, value) for key, value in record["extra"].items() if key != "sampled")
+    if record["exception"] is not None:
+        data["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    return orjson.dumps(data, default=str) + b"\n"
+
+
+class QueuedFileSink:
+    """Sink loguru: запись только кладется в очередь, сериализацией и файлом занимается поток-писатель.
+
+    Очередь ограничена max_queue записями. При переполнении записи ниже WARNING отбрасываются
+    (счетчик dropped), более важные ждут место не дольше block_timeout секунд.
+    С worker_id каждый воркер пишет и ротирует свой файл app.<worker_id>.log: общий файл воркеры
+    переименовывали бы друг у друга из-под открытых дескрипторов.
+    """
+
+    def __init__(self, directory: str, filename: str = "app.log", max_queue: int = 10000,
+                 rotation_bytes: int = 100 * 1024 * 1024, retention: int = 10, block_timeout: float = 0.05,
+                 batch_size: int = 512, worker_id: int | None = None):
+        self.directory = Path(directory)
+        base = Path(filename)
+        self.path = self.directory / (filename if worker_id is None else f"{base.stem}.{worker_id}{base.suffix}")
+        # Ротированные файлы всех воркеров, включая уже завершенных; открытые файлы под шаблон не попадают
+        self._rotated_re = re.compile(rf"^{re.escape(base.stem)}(?:\.\d+)?\.(?P<time>\d{{8}}-\d{{6}}\.\d{{6}})"
+                                      rf"{re.escape(base.suffix)}$")
+        self.rotation_bytes = rotation_bytes
+        self.retention = retention
+        self.block_timeout = block_timeout
+        self.batch_size = batch_size
+        self.queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def __call__(self, message) -> None:
+        record = message.record
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            if record["level"].no < WARNING_LEVEL:
+                self.dropped += 1
+                return
+        try:
+            self.queue.put(record, timeout=self.block_timeout)
+        except queue.Full:
+            self.dropped += 1
+
+    def _open(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, "ab", buffering=1024 * 1024)
+
+    def _rotate(self) -> None:
+        self._file.close()
+        self.path.rename(self.path.with_name(f"{self.path.stem}.{time.strftime('%Y%m%d-%H%M%S')}"
+                                             f".{time.time_ns() % 1_000_000:06d}{self.path.suffix}"))
+        rotated = sorted((match["time"], path) for path in self.directory.iterdir()
+                         if (match := self._rotated_re.match(path.name)))
+        for _, old in rotated[:-self.retention] if self.retention else []:
+            old.unlink(missing_ok=True)
+        self._open()
+
+    def _write(self, records: list) -> None:
+        lines = []
+        for record in records:
+            try:
+                lines.append(serialize_record(record))
+            except Exception as e:
+                sys.stderr.write(f"Не удалось записать лог: {e!r}\n")
+        try:
+            if self._file is None:
+                self._open()
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            self.written += len(lines)
+            if self._file.tell() >= self.rotation_bytes:
+                self._rotate()
+        except OSError as e:
+            sys.stderr.write(f"Не удалось записать лог: {e!r}\n")
+
+    def _run(self) -> None:
+        # Записи забираются пачками: одна системная запись на пачку, а не на каждую строку
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = records[-1] is None
+            self._write([record for record in records if record is not None])
+            if stop:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stop(self, timeout: float = 5.0) -> None:
+        # Остаток очереди дописывается до завершения процесса
+        self.queue.put(None)
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "dropped": self.dropped, "written": self.written}
+
+
+_sink: QueuedFileSink | None = None
+_handler_ids: list[int] = []
+
+
+def get_log_sink() -> QueuedFileSink | None:
+    return _sink
+
+
+def setup_logging() -> None:
+    global _sink
+    if _sink is not None:
+        return
+    logger.remove()
+    logger.configure(patcher=add_request_context)
+    _sink = QueuedFileSink(settings.LOG_DIR, max_queue=settings.LOG_QUEUE_SIZE,
+                           rotation_bytes=settings.LOG_ROTATION_MB * 1024 * 1024,
+                           retention=settings.LOG_RETENTION_FILES,
+                           worker_id=os.getpid() if settings.WEB_CONCURRENCY > 1 else None)
+    _handler_ids.append(logger.add(_sink, level=settings.LOG_LEVEL, format="{message}",
+                                   filter=lambda record: should_log(record, settings.LOG_SAMPLE_RATE)))
+    # В stderr только предупреждения и ошибки: этот вывод синхронный
+    _handler_ids.append(logger.add(sys.stderr, level=settings.LOG_STDERR_LEVEL))
+
+
+def shutdown_logging() -> None:
+    global _sink
+    for handler_id in _handler_ids:
+        logger.remove(handler_id)
+    _handler_ids.clear()
+    if _sink is not None:
+        _sink.stop()
+        _sink = None
+    logger.add(sys.stderr)
+
+
+class RequestContextMiddleware:
+    """Request id из заголовка X-Request-ID (или новый) в контексте логов и в ответе, итоговая запись о запросе.
+
+    Записи об успешных быстрых запросах семплируются, ошибки 5xx и запросы дольше slow_ms пишутся всегда.
+    """
+
+    def __init__(self, app: ASGIApp, slow_ms: int = 1000):
+        self.app = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = Headers(scope=scope).get(REQUEST_ID_HEADER, "")
+        if not REQUEST_ID_RE.match(request_id):
+            request_id = uuid4().hex
+        context = {"request_id": request_id, "upstream": []}
+        token = request_context.set(context)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(raw=message["headers"])[REQUEST_ID_HEADER] = request_id
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency_ms = round((time.perf_counter() - started) * 1000, 1)
+            route = scope.get("route")
+            context["route"] = route.path if route else "<unmatched>"
+            upstream = context.pop("upstream")
+            upstream_ms = [round(seconds * 1000, 1) for _, seconds in upstream]
+            logger.bind(sampled=status < 500 and latency_ms < self.slow_ms, upstream_calls=len(upstream),
+                        upstream_ms=round(sum(upstream_ms), 1),
+                        upstream=[{"endpoint": endpoint, "ms": ms} for (endpoint, _), ms in zip(upstream, upstream_ms)]
+                        ).info("{method} {path} {status} {latency_ms}ms", method=scope["method"], path=scope["path"],
+                               status=status, latency_ms=latency_ms)
+            request_context.reset(token)
@@ -0,0 +1,124 @@
+import time
+
+import anyio
+from prometheus_client import Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
+from prometheus_client.registry import Collector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Latency of HTTP requests",
+                            ["method", "route", "status"])
+UPSTREAM_LATENCY = Histogram("openweather_request_duration_seconds", "Latency of OpenWeather API calls",
+                             ["endpoint"])
+UPSTREAM_ERRORS = Counter("openweather_errors_total", "Failed OpenWeather API calls", ["endpoint", "reason"])
+DB_POOL_CHECKOUT_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time spent waiting for a pooled DB connection",
+                                  buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+
+class MetricsMiddleware:
+    """Гистограмма длительности запросов по шаблону маршрута и статусу ответа."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            REQUEST_LATENCY.labels(scope["method"], route.path if route else "<unmatched>",
+                                   str(status)).observe(time.perf_counter() - started)
+
+
+class StatsCollector(Collector):
+    """Снимает показатели кэшей, пула БД, пула хэширования и threadpool в момент запроса /metrics."""
+
+    def describe(self):
+        # Без описания реестр вызвал бы collect() при регистрации, до импорта остальных модулей
+        return []
+
+    def collect(self):
+        from db.engine import pool_stats
+        from monitoring.logs import get_log_sink
+        from templates.create_jinja import fragment_cache
+        from users.authorization.hashing import hashing_pool
+        from utilites.cache import geocode_cache, user_cache, weather_cache, weather_stale_cache
+        from utilites.quota import openweather_quota
+        from utilites.resilience import openweather_breaker
+
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache", "layer"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        hit_ratio = GaugeMetricFamily("cache_hit_ratio", "Cache hit ratio since start", labels=["cache"])
+        for cache in (weather_cache, weather_stale_cache, geocode_cache, user_cache, fragment_cache):
+            stats = cache.stats()
+            hits.add_metric([cache.namespace, "local"], stats["local_hits"])
+            hits.add_metric([cache.namespace, "redis"], stats["redis_hits"])
+            misses.add_metric([cache.namespace], stats["misses"])
+            hit_ratio.add_metric([cache.namespace], stats["hit_ratio"])
+        yield from (hits, misses, hit_ratio)
+
+        db_pool = pool_stats()
+        yield CounterMetricFamily("db_pool_checkouts", "DB pool checkouts", value=db_pool["checkouts"])
+        yield CounterMetricFamily("db_pool_connects", "New DB connections", value=db_pool["connects"])
+        if "checked_out" in db_pool:
+            yield GaugeMetricFamily("db_pool_checked_out", "DB connections in use", value=db_pool["checked_out"])
+            yield GaugeMetricFamily("db_pool_size", "DB pool size", value=db_pool["size"])
+
+        hashing = hashing_pool.stats()
+        yield GaugeMetricFamily("hashing_pool_pending", "Password hashing jobs in flight", value=hashing["pending"])
+        yield GaugeMetricFamily("hashing_pool_saturation", "Share of hashing pool capacity in use",
+                                value=hashing["saturation"])
+        yield CounterMetricFamily("hashing_pool_rejected", "Hashing jobs rejected on saturation",
+                                  value=hashing["rejected"])
+
+        breaker = openweather_breaker.stats()
+        yield GaugeMetricFamily("openweather_circuit_open", "1 while the OpenWeather circuit breaker is open",
+                                value=int(breaker["state"] != "closed"))
+        yield CounterMetricFamily("openweather_circuit_opened", "Times the circuit breaker opened",
+                                  value=breaker["opened_total"])
+
+        quota = openweather_quota.stats()
+        yield GaugeMetricFamily("openweather_quota_tokens", "Tokens left in the shared API key bucket",
+                                value=quota["tokens"])
+        yield GaugeMetricFamily("openweather_quota_capacity", "API calls per minute", value=quota["capacity"])
+        granted = CounterMetricFamily("openweather_quota_granted", "API calls allowed by the quota",
+                                      labels=["priority"])
+        denied = CounterMetricFamily("openweather_quota_denied", "API calls rejected by the quota",
+                                     labels=["priority"])
+        for priority, count in quota["granted"].items():
+            granted.add_metric([priority], count)
+        for priority, count in quota["denied"].items():
+            denied.add_metric([priority], count)
+        yield from (granted, denied)
+
+        log_sink = get_log_sink()
+        if log_sink is not None:
+            logs = log_sink.stats()
+            yield GaugeMetricFamily("log_queue_size", "Log records waiting for the writer thread",
+                                    value=logs["queued"])
+            yield CounterMetricFamily("log_records_dropped", "Log records dropped on a full queue",
+                                      value=logs["dropped"])
+
+        try:
+            limiter = anyio.to_thread.current_default_thread_limiter()
+        except RuntimeError:
+            return
+        yield GaugeMetricFamily("threadpool_borrowed_tokens", "Threadpool workers in use",
+                                value=limiter.borrowed_tokens)
+        yield GaugeMetricFamily("threadpool_total_tokens", "Threadpool size", value=limiter.total_tokens)
+
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
@@ -0,0 +1,76 @@
+# Профилирование отдельных запросов: pyinstrument, отчеты HTML и speedscope.
+# Middleware подключается в main.py только при PROFILING_ENABLED, иначе накладных расходов нет.
+
+import random
+import re
+import secrets
+import time
+from pathlib import Path
+from urllib.parse import parse_qs
+
+import anyio
+from pyinstrument import Profiler
+from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "profile"
+
+
+class ProfilingMiddleware:
+    """Профилирует запрос с заголовком X-Profile или параметром ?profile=, равным токену,
+    либо случайную долю запросов sample_rate."""
+
+    def __init__(self, app: ASGIApp, directory: str, token: str | None = None, sample_rate: float = 0.0,
+                 max_disk_bytes: int = 100 * 1024 * 1024, interval: float = 0.001):
+        self.app = app
+        self.directory = Path(directory)
+        self.token = token
+        self.sample_rate = sample_rate
+        self.max_disk_bytes = max_disk_bytes
+        self.interval = interval
+
+    def _is_requested(self, scope: Scope) -> bool:
+        if not self.token:
+            return False
+        value = dict(scope["headers"]).get(PROFILE_HEADER, b"").decode("latin-1")
+        if not value and PROFILE_QUERY_PARAM.encode() in scope["query_string"]:
+            value = parse_qs(scope["query_string"].decode("latin-1")).get(PROFILE_QUERY_PARAM, [""])[0]
+        # compare_digest принимает str только из ASCII, поэтому сравниваются байты
+        return bool(value) and secrets.compare_digest(value.encode(), self.token.encode())
+
+    def _should_profile(self, scope: Scope) -> bool:
+        return self._is_requested(scope) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            await anyio.to_thread.run_sync(self._save, profiler, scope)
+
+    def _save(self, profiler: Profiler, scope: Scope) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path_slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_") or "root"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{time.time_ns() % 1_000_000:06d}-{scope['method']}-{path_slug}"
+        session = profiler.last_session
+        (self.directory / f"{name}.html").write_text(HTMLRenderer().render(session), encoding="utf-8")
+        speedscope = SpeedscopeRenderer().render(session)
+        (self.directory / f"{name}.speedscope.json").write_text(speedscope, encoding="utf-8")
+        self._enforce_disk_limit()
+
+    def _enforce_disk_limit(self) -> None:
+        # Старые отчеты удаляются, пока суммарный размер больше лимита
+        files = sorted((path for path in self.directory.iterdir() if path.is_file()),
+                       key=lambda path: path.stat().st_mtime)
+        total = sum(path.stat().st_size for path in files)
+        for path in files:
+            if total <= self.max_disk_bytes:
+                break
+            total -= path.stat().st_size
+            path.unlink(missing_ok=True)
@@ -0,0 +1,43 @@
+import os
+
+from fastapi import APIRouter
+from fastapi.responses import ORJSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette import status
+from starlette.responses import Response
+
+from monitoring.health import readiness_probe
+from monitoring.metrics import stats_collector
+
+monitoring_router = APIRouter()
+
+
+def metrics_registry() -> CollectorRegistry:
+    # Под gunicorn счетчики и гистограммы суммируются по файлам всех воркеров,
+    # показатели кэшей и пулов - воркера, ответившего на запрос
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    MultiProcessCollector(registry)
+    registry.register(stats_collector)
+    return registry
+
+
+@monitoring_router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # async: сборщик читает лимитер threadpool из event loop
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
+
+@monitoring_router.get("/health/live", include_in_schema=False)
+async def liveness():
+    # Процесс и event loop отвечают; зависимости не проверяются, чтобы сбой БД не перезапускал воркеры
+    return ORJSONResponse({"status": "ok"})
+
+
+@monitoring_router.get("/health/ready", include_in_schema=False)
+async def readiness():
+    result = await readiness_probe.check()
+    return ORJSONResponse(result, status_code=status.HTTP_503_SERVICE_UNAVAILABLE
+                          if result["status"] == "unavailable" else status.HTTP_200_OK)
@@ -1,9 +1,92 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+from markupsafe import Markup
 from starlette.templating import Jinja2Templates
 
+from config import settings
+from utilites.static_assets import manifest, static_url
 from utilites.utils import image_path, image_number
 
-templates = Jinja2Templates(directory='templates')
+
+class FragmentCache:
+    """LRU готовых HTML-фрагментов. Ключ должен меняться вместе с данными фрагмента, поэтому TTL не нужен."""
+
+    namespace = "fragments"
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._local: OrderedDict[tuple, Markup] = OrderedDict()
+        self.local_hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Markup | None:
+        fragment = self._local.get(key)
+        if fragment is None:
+            self.misses += 1
+            return None
+        self.local_hits += 1
+        self._local.move_to_end(key)
+        return fragment
+
+    def set(self, key: tuple, fragment: Markup) -> None:
+        self._local[key] = fragment
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> dict:
+        total = self.local_hits + self.misses
+        return {"local_hits": self.local_hits, "redis_hits": 0, "misses": self.misses,
+                "hit_ratio": self.local_hits / total if total else 0.0, "local_size": len(self._local)}
+
+
+def create_bytecode_cache() -> FileSystemBytecodeCache:
+    if settings.TEMPLATE_BYTECODE_CACHE_DIR:
+        os.makedirs(settings.TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+    return FileSystemBytecodeCache(settings.TEMPLATE_BYTECODE_CACHE_DIR)
+
+
+def get_templates_version(directory: str = 'templates', static_manifest: dict | None = None) -> str:
+    # Входит в ETag страниц: после изменения шаблонов или статики браузеры получат новую разметку.
+    # Манифест учитывается, потому что страницы ссылаются на файлы с хэшем, а сборка удаляет прежние
+    digest = hashlib.blake2b(digest_size=8)
+    for path in sorted(Path(directory).glob('*.html')):
+        digest.update(path.read_bytes())
+    digest.update(json.dumps(static_manifest or {}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+# Скомпилированные шаблоны сохраняются на диск и переиспользуются воркерами после перезапуска
+env = Environment(loader=FileSystemLoader('templates'), autoescape=True, bytecode_cache=create_bytecode_cache())
+templates = Jinja2Templates(env=env)
+fragment_cache = FragmentCache(maxsize=settings.TEMPLATE_FRAGMENT_CACHE_SIZE)
+templates_version = get_templates_version(static_manifest=manifest)
+
+
+def location_card(location, current_page) -> Markup:
+    # Карточка зависит только от локации, показания погоды (dt), его возраста и номера страницы в форме удаления
+    if location.dt is None:
+        return Markup(env.get_template('card.html').render(location=location, current_page=current_page))
+    stale_minutes = None if location.stale_age is None else location.stale_age // 60
+    key = (location.location_id, location.dt, stale_minutes, current_page)
+    fragment = fragment_cache.get(key)
+    if fragment is None:
+        fragment = Markup(env.get_template('card.html').render(location=location, current_page=current_page))
+        fragment_cache.set(key, fragment)
+    return fragment
+
 
 # Регистрация фильтров
 templates.env.filters['image_path'] = image_path
 templates.env.filters['image_number'] = image_number
+templates.env.filters['static_url'] = static_url
+templates.env.globals['static_url'] = static_url
+templates.env.globals['location_card'] = location_card
@@ -1,26 +1,79 @@
+import asyncio
+import datetime
 import json
 import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
 from decimal import Decimal
-from unittest.mock import patch
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
 
+import httpx
 import sqlalchemy
 import pytest
+from loguru import logger
+from passlib.context import CryptContext
 from sqlalchemy.orm import sessionmaker
 
 from main import app
-from users.authorization.passwords import get_password_hash
+from users.authorization.hashing import HashingPool, password_needs_rehash
+from users.authorization.passwords import authenticate_user, get_current_user, get_password_hash
 from config import settings
 from fastapi.testclient import TestClient
-
-from utilites.depends import get_weather_service, get_user_dao, get_location_dao
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
+
+from locations.location_service import LocationService
+from users.authorization.jwt_token import create_jwt_token
+from utilites.depends import get_weather_service, get_two_dao, get_async_location_dao, get_async_user_dao
+from utilites.cache import (create_cache_redis, geocode_cache, geocode_cache_key, location_views, set_cache_redis,
+                            user_cache, weather_cache, weather_cache_key, weather_stale_cache)
+from utilites.quota import Priority, QuotaManager, openweather_quota
+from utilites.resilience import CircuitBreaker, openweather_breaker
+from utilites.http_client import get_http_client, init_http_client, set_http_client
+from utilites.single_flight import SingleFlight
+from utilites.static_assets import FingerprintedStaticFiles
+from utilites.static_build import build_static
+from gazetteer import Gazetteer, gazetteer
+from templates.create_jinja import fragment_cache, get_templates_version, location_card
+from monitoring.health import readiness_probe
+from monitoring.logs import QueuedFileSink, add_request_context, should_log
+from monitoring.profiling import ProfilingMiddleware
 from db.models import Base, User, Location
 from users.schemas import FormDataCreate, LocationCheck, WeatherCheck
+from utilites.exceptions import HashingPoolBusyException, OpenWeatherApiException, OpenWeatherRateLimitException
+from weather_prefetch import RENEW_LEASE_SCRIPT, WeatherPrefetcher
+from weather_service import WeatherApiService
+
+# Ответы OpenWeather подменяются фикстурами, запросы сохраняются для проверок
+FIXTURES = {"/geo/1.0/direct": "fixtures/find_locs_from_openweather_api.json",
+            "/data/2.5/weather": "fixtures/get_weather_from_openweather_api.json",
+            "/data/2.5/group": "fixtures/get_group_weather_from_openweather_api.json"}
+api_requests = []
+
+
+def openweather_handler(request: httpx.Request) -> httpx.Response:
+    api_requests.append(request)
+    with open(FIXTURES[request.url.path]) as f:
+        return httpx.Response(200, json=json.load(f))
+
+
+def create_mock_client(handler=openweather_handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+set_http_client(create_mock_client())
 
 
 class TestCase:
     def __init__(self):
-        self.user_dao = get_user_dao()
-        self.location_dao = get_location_dao()
+        self.user_dao = get_async_user_dao()
+        self.location_dao = get_async_location_dao()
         self.weather_service = get_weather_service()
 
 
@@ -52,6 +105,19 @@ def create_test_db():
             print(f"Произошла ошибка удаления тестовой БД: {e}")
 
 
+@pytest.fixture(autouse=True)
+def clear_caches():
+    weather_cache.clear()
+    geocode_cache.clear()
+    user_cache.clear()
+    fragment_cache.clear()
+    gazetteer.clear()
+    weather_stale_cache.clear()
+    openweather_breaker.reset()
+    openweather_quota.reset()
+    readiness_probe.reset()
+
+
 @pytest.fixture(scope="function")
 def create_authorization():
     client.post("/token", data={"login": "user1", "password": "qwerty1"})
@@ -73,6 +139,72 @@ def test_read_main():
     assert "Зарегистрироваться" in response.text
 
 
+def test_daos_share_one_session_factory(create_test_db):
+    assert get_async_user_dao()._session_factory is get_async_location_dao()._session_factory
+
+
+def test_import_has_no_database_side_effects(tmp_path):
+    database = tmp_path / "fresh.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}"}
+    subprocess.run([sys.executable, "-c", "import main; from db import engine; assert engine._async_engine is None"],
+                   env=env, check=True)
+    assert not database.exists()
+
+
+def test_daos_load_user_and_locations(create_test_db):
+    async def load_with_daos():
+        user = await get_async_user_dao().get_one(login="user1")
+        return user, await get_async_location_dao().get_all(user)
+
+    user, locations = asyncio.run(load_with_daos())
+    assert user.login == "user1"
+    assert [location.name for location in locations] == ["Париж"]
+
+
+def test_current_user_cached_between_requests(create_test_db):
+    class CountingUserDao:
+        calls = 0
+
+        async def get_one(self, login):
+            self.calls += 1
+            return await get_async_user_dao().get_one(login)
+
+    dao = CountingUserDao()
+    token = create_jwt_token({"sub": "user1"})
+    first = asyncio.run(get_current_user(token, dao))
+    second = asyncio.run(get_current_user(token, dao))
+    assert first == second
+    assert dao.calls == 1
+
+
+def test_login_rehashes_outdated_password(create_test_db):
+    weak_hash = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4).hash("qwerty2")
+    asyncio.run(test.user_dao.save_one("rehashuser", weak_hash))
+    user = asyncio.run(authenticate_user("rehashuser", "qwerty2", get_async_user_dao()))
+    assert user.login == "rehashuser"
+    new_hash = asyncio.run(test.user_dao.get_one(login="rehashuser")).password
+    assert new_hash != weak_hash
+    assert not password_needs_rehash(new_hash)
+
+
+def test_hashing_pool_recovers_after_worker_death():
+    pool = HashingPool(max_workers=1, max_queue=0)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            asyncio.run(pool.run(os._exit, 1))
+        assert asyncio.run(pool.run(abs, -1)) == 1
+    finally:
+        pool.shutdown()
+
+
+def test_hashing_pool_rejects_when_saturated():
+    pool = HashingPool(max_workers=1, max_queue=0)
+    pool.pending = 1
+    with pytest.raises(HashingPoolBusyException):
+        asyncio.run(pool.run(get_password_hash, "qwerty1"))
+    assert pool.stats()["rejected"] == 1
+
+
 def test_registration(create_test_db):
     response = client.post("/register", data=FormDataCreate(login="usertest", password="123456",
                                                             repeated_password="123456").model_dump())
@@ -80,7 +212,7 @@ def test_registration(create_test_db):
     assert "<title>Wheather</title>" in response.text
     assert "Авторизоваться" in response.text
     assert "Зарегистрироваться" in response.text
-    assert test.user_dao.get_one(login="usertest") is not None
+    assert asyncio.run(test.user_dao.get_one(login="usertest")) is not None
 
 
 def test_failure_registration_witn_not_latin_symbols(create_test_db):
@@ -89,7 +221,7 @@ def test_failure_registration_witn_not_latin_symbols(create_test_db):
     assert response.status_code == 200
     assert "Регистрация" in response.text
     assert "Имя пользователя и пароль должны содержать только латинские буквы и цифры" in response.text
-    assert test.user_dao.get_one(login="пользователь") is None
+    assert asyncio.run(test.user_dao.get_one(login="пользователь")) is None
 
 
 def test_failure_registration_witn_same_login(create_test_db):
@@ -130,15 +262,40 @@ def test_logout(create_test_db, create_authorization):
     assert "Зарегистрироваться" in response.text
 
 
-@patch('requests.get')
-def test_find_locations(mock_get):
-    # Определяем значение, которое будет возвращаться от апи
-    answer_from_api = "fixtures/find_locs_from_openweather_api.json"
-    with open(answer_from_api) as f:
-        mock_get.return_value.json.return_value = json.load(f)
+def test_redis_url_built_from_password_and_host(monkeypatch):
+    monkeypatch.setattr(settings, "REDIS_URL", None)
+    monkeypatch.setattr(settings, "REDIS_HOST", "redis")
+    monkeypatch.setattr(settings, "REDIS_PASSWORD", "p@ss")
+    assert settings.REDIS_CONNECTION_URL == "redis://:p%40ss@redis:6379/0"
+
 
-    mock_get.return_value.status_code = 200
-    locations = test.weather_service.find_locations_by_name(city="Сан-Паулу")
+def test_stalled_redis_falls_back_to_local_cache(monkeypatch):
+    # Сервер принимает соединения (backlog ядра), но не отвечает
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    monkeypatch.setattr(settings, "REDIS_URL", f"redis://127.0.0.1:{server.getsockname()[1]}")
+
+    async def lookup():
+        redis = create_cache_redis()
+        set_cache_redis(redis)
+        try:
+            return await weather_cache.get("x")
+        finally:
+            set_cache_redis(None)
+            await redis.close()
+
+    started = time.perf_counter()
+    try:
+        assert asyncio.run(lookup()) is None
+    finally:
+        server.close()
+    assert time.perf_counter() - started < settings.REDIS_SOCKET_TIMEOUT * 5
+
+
+def test_find_locations():
+    api_requests.clear()
+    locations = asyncio.run(test.weather_service.find_locations_by_name(city="Сан-Паулу"))
 
     # Проверка, что функция вернула ожидаемые Pydantic объекты
     expected_locations = [
@@ -157,25 +314,88 @@ def test_find_locations(mock_get):
 
     assert locations == expected_locations
 
-    # Убедимся, что requests.get был вызван с правильным URL
-    mock_get.assert_called_once_with(test.weather_service.find_locations_url,
-                                     params={'q': 'Сан-Паулу',
-                                             'appid': settings.WEATHER_API_KEY,
-                                             'limit': 5, 'lang': 'ru'})
+    # Убедимся, что API был вызван один раз с правильным URL
+    assert len(api_requests) == 1
+    assert str(api_requests[0].url.copy_with(query=None)) == test.weather_service.find_locations_url
+    assert dict(api_requests[0].url.params) == {'q': 'Сан-Паулу',
+                                                'appid': settings.WEATHER_API_KEY,
+                                                'limit': '5', 'lang': 'ru'}
+
+
+def test_find_locations_cached_by_normalized_query():
+    api_requests.clear()
+    first = asyncio.run(test.weather_service.find_locations_by_name(city="Сан-Паулу"))
+    second = asyncio.run(test.weather_service.find_locations_by_name(city="  сан-паулу "))
+    assert first == second
+    assert len(api_requests) == 1
+
+
+def test_empty_geocode_results_cached_briefly():
+    def empty_handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json=[])
+
+    weather_service = WeatherApiService(client=create_mock_client(empty_handler))
+    assert asyncio.run(weather_service.find_locations_by_name(city="Масква")) == []
+    expires_at, value = geocode_cache._local[geocode_cache_key("Масква")]
+    assert value == []
+    assert expires_at - time.monotonic() <= settings.GEOCODE_NEGATIVE_CACHE_TTL
+
+
+def test_gazetteer_learns_from_geo_api_and_autocompletes():
+    api_requests.clear()
+    asyncio.run(test.weather_service.find_locations_by_name(city="Сан-Паулу"))
+    locations = asyncio.run(test.weather_service.find_locations_by_name(city="сан паулу"))
+    assert len(api_requests) == 1
+    assert [location.name for location in locations] == ["Сан-Паулу"]
+    assert asyncio.run(test.weather_service.find_locations_by_name(city="Sao Paulo")) == locations
+    assert [place["name"] for place in gazetteer.autocomplete("сан")] == ["San Paolo", "Сан-Паулу"]
+    assert [place["name"] for place in gazetteer.autocomplete("bri")] == ["Briga Marina"]
+    assert gazetteer.autocomplete("xyz") == []
+
+
+def test_gazetteer_loads_geonames_dump(tmp_path):
+    dump = tmp_path / "cities.txt"
+    rows = [["524901", "Moscow", "Moscow", "Moskau,Москва,莫斯科", "55.75222", "37.61556", "P", "PPLC", "RU",
+             "", "48", "", "", "", "10381222"],
+            ["5202009", "Moscow", "Moscow", "", "41.33673", "-75.51852", "P", "PPL", "US",
+             "", "PA", "", "", "", "2011"],
+            ["2643743", "London", "London", "Лондон", "51.50853", "-0.12574", "A", "ADM1", "GB",
+             "", "ENG", "", "", "", "8961989"]]
+    dump.write_text("\n".join("\t".join(row) for row in rows), encoding="utf-8")
+    assert gazetteer.load_geonames(str(dump)) == 2
+    assert [(place["name"], place["country"]) for place in gazetteer.autocomplete("mosk")] == [("Москва", "RU")]
+    assert [place["country"] for place in gazetteer.lookup("moscow")] == ["RU", "US"]
+    assert gazetteer.lookup("London") == []
+
+
+def test_gazetteer_learned_places_kept_apart_and_bounded():
+    learned = Gazetteer(learn_max_keys=2)
+    learned.add({"name": "Москва", "lat": 55.75, "lon": 37.62, "country": "RU", "state": "-"},
+                ["Moscow", "Москва"])
+    learned.add({"name": "Лондон", "lat": 51.5, "lon": -0.13, "country": "GB", "state": "-"},
+                ["London", "Лондон"])
+    assert learned._keys == []
+    assert [place["name"] for place in learned.autocomplete("mos")] == ["Москва"]
+    # Ключ "london" не помещается в предел, место не запоминается
+    assert learned.lookup("london") == [] and len(learned) == 1
+
 
+@pytest.fixture(scope="function")
+def reset_city_ids(create_test_db):
+    # Главная страница сохраняет city_id локаций; тест без city_id не зависит от порядка запуска
+    async def reset():
+        locations = await test.location_dao.get_all(await test.user_dao.get_one(login="user1"))
+        await test.location_dao.set_city_ids({location.id: None for location in locations})
 
-@patch('requests.get')
-def test_weather_for_location(mock_get, create_test_db):
-    answer_from_api = "fixtures/get_weather_from_openweather_api.json"
-    with open(answer_from_api) as f:
-        mock_get.return_value.json.return_value = json.load(f)
+    asyncio.run(reset())
 
-    mock_get.return_value.status_code = 200
 
-    current_user = test.user_dao.get_one(login="user1")
-    user_locations = test.location_dao.get_all(current_user)
-    location_with_weather = test.weather_service.get_user_locations_with_weather(
-        user_locations=user_locations)
+def test_weather_for_location(reset_city_ids):
+    api_requests.clear()
+    current_user = asyncio.run(test.user_dao.get_one(login="user1"))
+    user_locations = asyncio.run(test.location_dao.get_all(current_user))
+    location_with_weather = asyncio.run(test.weather_service.get_user_locations_with_weather(
+        user_locations=user_locations))
 
     expected_location = [
         WeatherCheck(
@@ -185,35 +405,353 @@ def test_weather_for_location(mock_get, create_test_db):
             temp=5,
             feels_like=1,
             wind_speed=5,
+            dt=1737038425,
             country='FR',
             state='Ile-de-France'
         )
     ]
     assert location_with_weather == expected_location
 
-    mock_get.assert_called_once_with(test.weather_service.get_weather_url,
-                                     params={"lat": Decimal('48.8588897000'),
-                                             "lon": Decimal('2.3200410217'),
-                                             "appid": settings.WEATHER_API_KEY,
-                                             "lang": "ru",
-                                             "units": "metric"}
-                                     )
+    # Без city_id погода запрашивается по координатам
+    assert [request.url.path for request in api_requests] == ["/data/2.5/weather"]
+    params = api_requests[0].url.params
+    assert str(api_requests[0].url.copy_with(query=None)) == test.weather_service.get_weather_url
+    assert Decimal(params["lat"]) == Decimal('48.8588897')
+    assert Decimal(params["lon"]) == Decimal('2.3200410217')
+    assert (params["appid"], params["lang"], params["units"]) == (settings.WEATHER_API_KEY, "ru", "metric")
+
+
+def test_main_page_fetches_weather_only_for_current_page(create_test_db):
+    token = create_jwt_token({"sub": "user1"})
+    two_dao = get_two_dao()
+    api_requests.clear()
+    first_page = asyncio.run(LocationService.get_result_locations(1, token, two_dao, test.weather_service))
+    assert (first_page.total, first_page.pages, len(first_page.items)) == (1, 1, 1)
+    assert len(api_requests) == 1
+
+    api_requests.clear()
+    second_page = asyncio.run(LocationService.get_result_locations(2, token, two_dao, test.weather_service))
+    assert (second_page.total, second_page.pages, second_page.items) == (1, 1, [])
+    assert api_requests == []
+
+    # id города из ответа сохранен, следующий запрос идет пакетом через /group
+    assert asyncio.run(test.location_dao.get_one(name="Париж")).city_id == 6545270
+    weather_cache.clear()
+    assert asyncio.run(LocationService.get_result_locations(1, token, two_dao, test.weather_service)) == first_page
+    assert [request.url.path for request in api_requests] == ["/data/2.5/group"]
+    assert api_requests[0].url.params["id"] == "6545270"
+
+
+def test_batched_weather_falls_back_to_coordinates():
+    def group_handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/data/2.5/group":
+            api_requests.append(request)
+            weather = json.loads(open(FIXTURES["/data/2.5/weather"]).read())
+            city_ids = request.url.params["id"].split(",")
+            return httpx.Response(200, json={"cnt": len(city_ids) - 1, "list": [
+                {**weather, "id": int(city_id)} for city_id in city_ids if city_id != "7"]})
+        return openweather_handler(request)
+
+    api_requests.clear()
+    weather_service = WeatherApiService(client=create_mock_client(group_handler))
+    user_locations = [SimpleNamespace(id=number, name=f"Город {number}", latitude=Decimal(number),
+                                      longitude=Decimal(number), country="RU", state="-",
+                                      city_id=number if number < 30 else None)
+                      for number in range(1, 33)]
+    saved_city_ids = {}
+    location_dao = SimpleNamespace(set_city_ids=lambda city_ids: asyncio.sleep(0, saved_city_ids.update(city_ids)))
+    locations_with_weather = asyncio.run(weather_service.get_user_locations_with_weather(user_locations,
+                                                                                         location_dao))
+
+    assert [location.location_id for location in locations_with_weather] == list(range(1, 33))
+    assert all(location.temp == 5 for location in locations_with_weather)
+    paths = [request.url.path for request in api_requests]
+    # 29 локаций с city_id - два пакета; без city_id и не найденная в пакете - по координатам
+    assert paths.count("/data/2.5/group") == 2
+    assert paths.count("/data/2.5/weather") == 4
+    assert saved_city_ids == {30: 6545270, 31: 6545270, 32: 6545270}
+
+
+def test_location_card_cached_by_weather_reading():
+    location = WeatherCheck(location_id=1, name="Париж", main="Ясно", temp=5, feels_like=3, wind_speed=2,
+                            dt=1700000000, country="FR")
+    card = location_card(location, 1)
+    assert "/static/images/sun.png" in card and "Париж" in card
+    assert location_card(location, 1) is card
+    assert location_card(location.model_copy(update={"dt": 1700000600, "temp": 7}), 1) is not card
+    assert location_card(location, 2) is not card
+    assert location_card(WeatherCheck(location_id=2, name="Рим", country="IT"), 1) == \
+        location_card(WeatherCheck(location_id=2, name="Рим", country="IT"), 1)
+    assert fragment_cache.stats()["local_hits"] == 1
+    assert fragment_cache.stats()["local_size"] == 3
+
+
+def test_weather_cache_shared_between_close_coordinates():
+    api_requests.clear()
+    first = asyncio.run(test.weather_service.get_weather_for_location(Decimal('48.8588897'), Decimal('2.3200410')))
+    second = asyncio.run(test.weather_service.get_weather_for_location(Decimal('48.8612'), Decimal('2.3187')))
+    assert first == second
+    assert len(api_requests) == 1
+    assert weather_cache.stats()["local_hits"] >= 1
+
+
+def test_prefetch_warms_weather_cache(create_test_db):
+    prefetcher = WeatherPrefetcher(test.weather_service, get_async_location_dao(), calls_per_minute=60_000)
+    api_requests.clear()
+    assert asyncio.run(prefetcher.run_once()) == 1
+    asyncio.run(test.weather_service.get_weather_for_location(Decimal('48.8588897'), Decimal('2.3200410')))
+    assert len(api_requests) == 1
+
+
+def test_location_views_recorded_only_for_prefetch(monkeypatch):
+    location = SimpleNamespace(id=1, name="Париж", latitude=Decimal("48.85"), longitude=Decimal("2.32"),
+                               country="FR", state="-", city_id=None)
+    location_views._local.clear()
+    asyncio.run(test.weather_service.get_user_locations_with_weather([location]))
+    assert asyncio.run(location_views.recent()) == {}
+    # Обновление в отдельном процессе: в веб-приложении цикл выключен, просмотры записываются
+    monkeypatch.setattr(settings, "WEATHER_PREFETCH_RECORD_VIEWS", True)
+    asyncio.run(test.weather_service.get_user_locations_with_weather([location]))
+    assert list(asyncio.run(location_views.recent())) == [weather_cache_key(Decimal("48.85"), Decimal("2.32"),
+                                                                            lang="ru", units="metric")]
+
+
+class LeaseRedis:
+    """Аренда в памяти: скрипты продления и освобождения выполняются так же, как в Redis."""
+
+    def __init__(self):
+        self.owner = None
+
+    async def eval(self, script, numkeys, key, owner, *args):
+        if script == RENEW_LEASE_SCRIPT:
+            if self.owner in (None, owner):
+                self.owner = owner
+                return 1
+            return 0
+        if self.owner == owner:
+            self.owner = None
+            return 1
+        return 0
+
+
+def test_prefetch_lease_released_on_cancel():
+    async def run() -> None:
+        leader = WeatherPrefetcher(test.weather_service, get_async_location_dao(), interval=3600)
+        follower = WeatherPrefetcher(test.weather_service, get_async_location_dao(), interval=3600)
+        leader.run_once = follower.run_once = AsyncMock(return_value=0)
+        task = asyncio.create_task(leader.run_forever())
+        await asyncio.sleep(0.01)
+        assert redis.owner == leader.owner and not await follower.acquire_lease()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert redis.owner is None
+        assert await follower.acquire_lease()
+        # Освободить аренду может только владелец
+        await leader.release_lease()
+        assert redis.owner == follower.owner
+
+    redis = LeaseRedis()
+    set_cache_redis(redis)
+    try:
+        asyncio.run(run())
+    finally:
+        set_cache_redis(None)
 
 
-@patch('requests.get')
-def test_get_locations_page_without_authorization(mock_get, create_test_db):
-    answer_from_api = "fixtures/find_locs_from_openweather_api.json"
-    with open(answer_from_api) as f:
-        mock_get.return_value.json.return_value = json.load(f)
+def test_concurrent_lookups_share_one_upstream_call():
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(0.05)
+        return openweather_handler(request)
+
+    async def lookup_many(weather_service: WeatherApiService) -> list:
+        weather = [weather_service.get_weather_for_location(Decimal('55.75'), Decimal('37.62')) for _ in range(5)]
+        locations = [weather_service.find_locations_by_name(city="Сан-Паулу") for _ in range(5)]
+        return await asyncio.gather(*weather, *locations)
+
+    api_requests.clear()
+    results = asyncio.run(lookup_many(WeatherApiService(client=create_mock_client(slow_handler))))
+    assert all(result == results[0] for result in results[:5])
+    assert all(result == results[5] for result in results[5:])
+    assert len(api_requests) == 2
+
+
+def test_single_flight_followers_survive_leader_cancel():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def run() -> list:
+        flight = SingleFlight("test")
+        leader = asyncio.create_task(flight.do("key", fetch))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do("key", fetch)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await asyncio.gather(*followers)
+
+    # Ожидающие не отменены сами и получают результат повторного вызова
+    assert asyncio.run(run()) == [2, 2, 2]
+
+
+def test_weather_api_error():
+    def failing_handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(401, json={"cod": 401, "message": "Invalid API key"})
+
+    weather_service = WeatherApiService(client=create_mock_client(failing_handler))
+    with pytest.raises(OpenWeatherApiException):
+        asyncio.run(weather_service.get_weather_for_location(Decimal('48.85'), Decimal('2.32')))
+
+
+def test_upstream_errors_retried_then_circuit_opens_and_stale_weather_served():
+    responses = [503, 200, 500, 500, 500, 500, 500, 500]
+
+    def flaky_handler(request: httpx.Request) -> httpx.Response:
+        api_requests.append(request)
+        status_code = responses.pop(0)
+        if status_code != 200:
+            return httpx.Response(status_code, json={"cod": status_code, "message": "Upstream error"})
+        with open(FIXTURES[request.url.path]) as f:
+            return httpx.Response(200, json=json.load(f))
+
+    api_requests.clear()
+    weather_service = WeatherApiService(client=create_mock_client(flaky_handler))
+    location = SimpleNamespace(id=1, name="Париж", latitude=Decimal("48.85"), longitude=Decimal("2.32"),
+                               country="FR", state="-")
+    assert asyncio.run(weather_service.get_location_with_weather(location)).stale_age is None
+    assert len(api_requests) == 2
+
+    weather_cache.clear()
+    breaker = openweather_breaker
+    breaker.failure_threshold = 2
+    try:
+        stale = asyncio.run(weather_service.get_location_with_weather(location))
+        assert (stale.temp, stale.stale_age) == (5, 0)
+        # Три неудачные попытки одного вызова - одна ошибка для предохранителя
+        assert breaker.state == CircuitBreaker.CLOSED and breaker.failures == 1
+        assert len(api_requests) == 5
+        asyncio.run(weather_service.get_location_with_weather(location))
+        assert breaker.state == CircuitBreaker.OPEN
+        assert len(api_requests) == 8
+
+        # Пока предохранитель открыт, API не вызывается
+        assert asyncio.run(weather_service.get_location_with_weather(location)).stale_age == 0
+        assert len(api_requests) == 8
+        assert "openweather_circuit_open 1.0" in client.get("/metrics").text
+    finally:
+        breaker.failure_threshold = settings.WEATHER_BREAKER_FAILURE_THRESHOLD
+
+
+def test_circuit_breaker_half_open_probe():
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    breaker.recovery_timeout = 60
+    assert not breaker.allow()
+    breaker.opened_at -= 60
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_quota_rejection_does_not_hold_half_open_probe(monkeypatch):
+    async def reject(priority):
+        raise OpenWeatherRateLimitException
+
+    breaker = openweather_breaker
+    breaker.state, breaker.opened_at = CircuitBreaker.OPEN, time.monotonic() - breaker.recovery_timeout
+    monkeypatch.setattr(openweather_quota, "acquire", reject)
+    with pytest.raises(OpenWeatherRateLimitException):
+        asyncio.run(test.weather_service.get_weather_for_location(Decimal("48.85"), Decimal("2.32")))
+    monkeypatch.undo()
+    api_requests.clear()
+    asyncio.run(test.weather_service.get_weather_for_location(Decimal("48.85"), Decimal("2.32")))
+    assert len(api_requests) == 1 and breaker.state == CircuitBreaker.CLOSED
+
+
+def test_invalid_json_counts_as_upstream_failure():
+    def broken_handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, text="<html>Bad gateway</html>")
+
+    weather_service = WeatherApiService(client=create_mock_client(broken_handler))
+    with pytest.raises(OpenWeatherApiException):
+        asyncio.run(weather_service.get_weather_for_location(Decimal("48.85"), Decimal("2.32")))
+    assert openweather_breaker.failures == 1
+
+
+def test_upstream_call_deadline(monkeypatch):
+    async def slow_handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(1)
+        return openweather_handler(request)
+
+    monkeypatch.setattr(settings, "WEATHER_API_DEADLINE", 0.05)
+    weather_service = WeatherApiService(client=create_mock_client(slow_handler))
+    started = time.perf_counter()
+    with pytest.raises(OpenWeatherApiException):
+        asyncio.run(weather_service.get_weather_for_location(Decimal("48.85"), Decimal("2.32")))
+    assert time.perf_counter() - started < 0.5
+
+
+def test_http_client_initialized_once_in_startup():
+    mock_client = get_http_client()
+    assert asyncio.run(init_http_client()) is mock_client
+    set_http_client(None)
+    try:
+        client = asyncio.run(init_http_client())
+        assert get_http_client() is client
+        asyncio.run(client.aclose())
+    finally:
+        set_http_client(mock_client)
+
+
+def test_quota_keeps_reserve_for_interactive_calls():
+    quota = QuotaManager("test", calls_per_minute=4)
+    asyncio.run(quota.acquire(Priority.BACKGROUND))
+    asyncio.run(quota.acquire(Priority.BACKGROUND))
+    # Фоновые запросы не трогают вторую половину бакета и не ждут токен
+    with pytest.raises(OpenWeatherRateLimitException):
+        asyncio.run(quota.acquire(Priority.BACKGROUND))
+    asyncio.run(quota.acquire(Priority.GEOCODE))
+    asyncio.run(quota.acquire(Priority.INTERACTIVE))
+    assert quota.stats()["granted"] == {"interactive": 1, "geocode": 1, "background": 2}
+    assert quota.stats()["denied"] == {"interactive": 0, "geocode": 0, "background": 1}
+
+    # Без Redis каждый из воркеров расходует только свою долю квоты ключа
+    shared_quota = QuotaManager("test", calls_per_minute=4, processes=2)
+    asyncio.run(shared_quota.acquire(Priority.INTERACTIVE))
+    asyncio.run(shared_quota.acquire(Priority.INTERACTIVE))
+    assert shared_quota.stats()["tokens"] < 1
+
+
+def test_locations_with_weather_keep_order_and_skip_failures():
+    def partly_failing_handler(request: httpx.Request) -> httpx.Response:
+        if request.url.params["lat"] == "2":
+            return httpx.Response(500, json={"cod": 500, "message": "Internal error"})
+        return openweather_handler(request)
+
+    weather_service = WeatherApiService(client=create_mock_client(partly_failing_handler))
+    user_locations = [SimpleNamespace(id=number, name=f"Город {number}", latitude=Decimal(number),
+                                      longitude=Decimal(number), country="RU", state="-")
+                      for number in range(1, 6)]
+    locations_with_weather = asyncio.run(weather_service.get_user_locations_with_weather(user_locations))
+
+    assert [location.location_id for location in locations_with_weather] == [1, 2, 3, 4, 5]
+    assert locations_with_weather[1].temp is None
+    assert all(location.temp == 5 for location in locations_with_weather if location.location_id != 2)
+
+
+def test_get_locations_page_without_authorization(create_test_db):
     response = client.get("/locations", params={"city": "Сан-Паулу"})
     assert "Необходимо сначала авторизоваться" in response.text
 
 
-@patch('requests.get')
-def test_read_main_with_authorization(mock_get, create_test_db, create_authorization):
-    answer_from_api = "fixtures/get_weather_from_openweather_api.json"
-    with open(answer_from_api) as f:
-        mock_get.return_value.json.return_value = json.load(f)
+def test_read_main_with_authorization(create_test_db, create_authorization):
     response = client.get("/")
     assert response.status_code == 200
     assert "<title>Wheather</title>" in response.text
@@ -224,6 +762,29 @@ def test_read_main_with_authorization(mock_get, create_test_db, create_authoriza
 
 
 
+def test_pages_answer_304_while_data_unchanged(create_test_db, create_authorization):
+    response = client.get("/")
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+    not_modified = client.get("/", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+    assert not_modified.headers["etag"] == etag
+    assert client.get("/", params={"page": 2}, headers={"If-None-Match": etag}).status_code == 200
+
+    # Новое показание погоды меняет ETag
+    weather_cache.clear()
+    with open(FIXTURES["/data/2.5/weather"]) as f:
+        newer_weather = {**json.load(f), "dt": 1737039025}
+    asyncio.run(weather_cache.set(weather_cache_key(Decimal('48.8588897'), Decimal('2.3200410217200766'),
+                                                    lang="ru", units="metric"), newer_weather))
+    assert client.get("/", headers={"If-None-Match": etag}).status_code == 200
+
+    response = client.get("/locations", params={"city": "Сан-Паулу"})
+    assert client.get("/locations", params={"city": "Сан-Паулу"},
+                      headers={"If-None-Match": f'"x", {response.headers["etag"]}'}).status_code == 304
+
+
 def test_add_locations_for_user(create_test_db, create_authorization):
     location = (
         LocationCheck(
@@ -235,7 +796,7 @@ def test_add_locations_for_user(create_test_db, create_authorization):
     )
     response = client.post("/add_location", data=location.model_dump())
     assert response.status_code == 200
-    assert test.location_dao.get_one(name="Сан-Паулу") is not None
+    assert asyncio.run(test.location_dao.get_one(name="Сан-Паулу")) is not None
     assert "<title>Wheather</title>" in response.text
     assert "Сан-Паулу" in response.text
     assert "Сохраненные локации" in response.text
@@ -251,12 +812,198 @@ def test_add_same_location_for_user(create_test_db, create_authorization):
 
 
 def test_delete_locations_for_user(create_test_db, create_authorization):
-    location = test.location_dao.get_one(name="Париж")
+    location = asyncio.run(test.location_dao.get_one(name="Париж"))
+    asyncio.run(test.user_dao.save_one("intruder", get_password_hash("qwerty2")))
+    intruder = TestClient(app, headers={"Authorization": f"Bearer {create_jwt_token({'sub': 'intruder'})}"})
+    intruder.post("/delete_location", data={"location_id": location.id, "location_name": location.name,
+                                            "current_page": 1})
+    # Чужую локацию удалить нельзя
+    assert asyncio.run(test.location_dao.get_one(name="Париж")) is not None
     response = client.post("/delete_location", data={"location_id": location.id,
                                                      "location_name": location.name,
                                                      "current_page": 1})
     assert response.status_code == 200
-    assert test.location_dao.get_one(name="Париж") is None
+    assert asyncio.run(test.location_dao.get_one(name="Париж")) is None
     assert "Париж" not in response.text
     assert "Пользователь: user1" in response.text
     assert "Выйти" in response.text
+
+
+def test_api_locations_crud_with_bearer_token(create_test_db):
+    api_client = TestClient(app, headers={"Authorization": f"Bearer {create_jwt_token({'sub': 'user1'})}"})
+    location = LocationCheck(name="Рио", lat=Decimal("-22.9"), lon=Decimal("-43.2"), country="BR")
+    response = api_client.post("/api/v1/locations", json=location.model_dump(mode="json"))
+    assert response.status_code == 201
+    location_id = response.json()["id"]
+    assert api_client.post("/api/v1/locations", json=location.model_dump(mode="json")).status_code == 400
+
+    response = api_client.get("/api/v1/locations", params={"page": 1})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert [item["name"] for item in response.json()["items"]] == ["Сан-Паулу", "Рио"]
+    assert response.json()["total"] == 2
+    assert response.json()["items"][0]["temp"] == 5
+
+    assert api_client.delete(f"/api/v1/locations/{location_id}").status_code == 204
+    assert api_client.delete(f"/api/v1/locations/{location_id}").json() == {"detail": "Локация не найдена"}
+
+
+def test_api_etag_and_errors(create_test_db):
+    api_client = TestClient(app, headers={"Authorization": f"Bearer {create_jwt_token({'sub': 'user1'})}"})
+    response = api_client.get("/api/v1/geocode", params={"city": "Сан-Паулу"})
+    assert response.status_code == 200
+    assert response.json()[0]["name"] == "Сан-Паулу"
+    cached = api_client.get("/api/v1/geocode", params={"city": "Сан-Паулу"},
+                            headers={"If-None-Match": response.headers["etag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    api_client.get("/api/v1/geocode", params={"city": "Briga"})
+    response = api_client.get("/api/v1/autocomplete", params={"q": "Бриг"})
+    assert response.json() == [{"name": "Briga Marina", "lat": "38.0732138", "lon": "15.4908513", "country": "IT",
+                                "state": "Sicily"}]
+
+    response = TestClient(app).get("/api/v1/locations")
+    assert response.status_code == 401
+    assert response.json() == {"detail": "Необходимо сначала авторизоваться"}
+
+
+def test_metrics_endpoint(create_test_db):
+    client.get("/authorization")
+    asyncio.run(test.weather_service.get_weather_for_location(Decimal('10.5'), Decimal('20.5')))
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'http_request_duration_seconds_count{method="GET",route="/authorization",status="200"}' in response.text
+    assert 'openweather_request_duration_seconds_count{endpoint="weather"}' in response.text
+    assert 'cache_hits_total{cache="weather",layer="local"}' in response.text
+    assert "threadpool_borrowed_tokens" in response.text
+
+
+def test_access_log_carries_request_context(create_test_db, tmp_path):
+    sink = QueuedFileSink(str(tmp_path))
+    logger.configure(patcher=add_request_context)
+    handler_id = logger.add(sink, format="{message}", filter=lambda record: should_log(record, sample_rate=1.0))
+    api_client = TestClient(app, headers={"Authorization": f"Bearer {create_jwt_token({'sub': 'user1'})}"})
+    try:
+        response = api_client.get("/api/v1/geocode", params={"city": "Сан-Паулу"},
+                                  headers={"X-Request-ID": "req-42"})
+    finally:
+        logger.remove(handler_id)
+        sink.stop()
+    assert response.headers["x-request-id"] == "req-42"
+    assert len(api_client.get("/authorization").headers["x-request-id"]) == 32
+    records = [json.loads(line) for line in (tmp_path / "app.log").read_text().splitlines()]
+    access = next(record for record in records if record["message"].startswith("GET /api/v1/geocode 200"))
+    assert access["request_id"] == "req-42"
+    assert access["user"] == "user1"
+    assert access["route"] == "/api/v1/geocode"
+    assert access["upstream_calls"] == 1 and access["upstream"][0]["endpoint"] == "geo"
+    assert "sampled" not in access
+
+
+def test_log_sampling_and_bounded_queue(tmp_path):
+    info, warning = logger.level("INFO"), logger.level("WARNING")
+    assert not should_log({"extra": {"sampled": True}, "level": info}, sample_rate=0.0)
+    assert should_log({"extra": {"sampled": True}, "level": warning}, sample_rate=0.0)
+    assert should_log({"extra": {}, "level": info}, sample_rate=0.0)
+
+    sink = QueuedFileSink(str(tmp_path), max_queue=1, block_timeout=0.01)
+    writer_blocked = threading.Event()
+    sink._write = lambda records: writer_blocked.wait()
+    message = SimpleNamespace(record={"level": info})
+    sink(message)
+    while sink.queue.qsize():
+        time.sleep(0.001)
+    sink(message)
+    sink(message)
+    sink(SimpleNamespace(record={"level": warning}))
+    writer_blocked.set()
+    sink.stop()
+    assert sink.dropped == 2
+
+
+def test_log_files_per_worker(tmp_path):
+    record = {"time": datetime.datetime.now(), "level": logger.level("INFO"), "message": "x" * 100,
+              "name": "tests", "function": "test", "line": 1, "extra": {}, "exception": None}
+    sinks = [QueuedFileSink(str(tmp_path), rotation_bytes=50, retention=2, worker_id=worker_id)
+             for worker_id in (101, 102)]
+    for _ in range(3):
+        for sink in sinks:
+            sink(SimpleNamespace(record=record))
+            time.sleep(0.01)
+    for sink in sinks:
+        sink.stop()
+    names = sorted(path.name for path in tmp_path.iterdir())
+    assert "app.101.log" in names and "app.102.log" in names
+    # Срок хранения общий для всех воркеров, открытые файлы не удаляются
+    assert len(names) == 4
+
+
+def test_health_endpoints(create_test_db):
+    assert client.get("/health/live").json() == {"status": "ok"}
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ok"
+    assert response.json()["checks"]["postgres"]["ok"]
+    assert response.json()["checks"]["redis"] == {"ok": True, "enabled": False}
+
+    for _ in range(settings.WEATHER_BREAKER_FAILURE_THRESHOLD):
+        openweather_breaker.record_failure()
+    assert client.get("/health/ready").json()["status"] == "ok"
+    readiness_probe.reset()
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "degraded"
+    assert response.json()["checks"]["openweather"] == {"ok": False, "circuit": "open"}
+
+
+def test_html_responses_compressed():
+    response = client.get("/authorization", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert "<title>Wheather</title>" in response.text
+    assert client.get("/authorization", headers={"Accept-Encoding": "br"}).headers["content-encoding"] == "br"
+    assert "content-encoding" not in client.get("/authorization", headers={"Accept-Encoding": "identity"}).headers
+
+
+def test_static_build_fingerprints_and_precompresses(tmp_path):
+    source = tmp_path / "static"
+    (source / "images").mkdir(parents=True)
+    (source / "styles.css").write_text("body { color: #1d60a5; }\n" * 100)
+    (source / "images" / "sun.png").write_bytes(b"\x89PNG" + bytes(100))
+    build = tmp_path / "build"
+    manifest = build_static(str(source), str(build))
+    assert sorted(manifest) == ["images/sun.png", "styles.css"]
+    css = manifest["styles.css"]
+    assert (build / css).is_file() and (build / f"{css}.gz").is_file() and (build / f"{css}.br").is_file()
+    assert not (build / f"{manifest['images/sun.png']}.gz").exists()
+    # Страницы ссылаются на файлы с хэшем, поэтому новая сборка меняет ETag страниц
+    assert get_templates_version(static_manifest=manifest) != get_templates_version()
+
+    static_client = TestClient(Starlette(routes=[Mount("/static", FingerprintedStaticFiles(
+        directory=str(build), fingerprinted=set(manifest.values())))]))
+    response = static_client.get(f"/static/{css}", headers={"Accept-Encoding": "br, gzip"})
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.text.startswith("body { color: #1d60a5; }")
+    conditional_headers = {"Accept-Encoding": "br", "If-None-Match": response.headers["etag"]}
+    assert static_client.get(f"/static/{css}", headers=conditional_headers).status_code == 304
+    assert static_client.get("/static/styles.css").headers["cache-control"] == "public, no-cache"
+
+
+def test_profiling_middleware_writes_reports_only_when_requested(tmp_path):
+    async def homepage(request):
+        return PlainTextResponse("ok")
+
+    profiled_app = ProfilingMiddleware(Starlette(routes=[Route("/", homepage)]), directory=str(tmp_path),
+                                       token="secret")
+    profiled_client = TestClient(profiled_app)
+    profiled_client.get("/")
+    profiled_client.get("/", headers={"X-Profile": "wrong"})
+    assert profiled_client.get("/", params={"profile": "é"}).status_code == 200
+    assert profiled_client.get("/", headers={"X-Profile": "é".encode("latin-1")}).status_code == 200
+    assert list(tmp_path.iterdir()) == []
+    profiled_client.get("/", headers={"X-Profile": "secret"})
+    profiled_client.get("/", params={"profile": "secret"})
+    assert len(list(tmp_path.glob("*.html"))) == 2
+    assert len(list(tmp_path.glob("*.speedscope.json"))) == 2
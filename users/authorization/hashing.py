@@ -0,0 +1,82 @@
+# Хэширование паролей bcrypt в отдельном пуле процессов
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable
+
+from passlib.context import CryptContext
+
+from config import settings
+from utilites.exceptions import HashingPoolBusyException
+
+# min_rounds = max_rounds: при смене BCRYPT_ROUNDS needs_update помечает старые хэши
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+                           bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+                           bcrypt__max_rounds=settings.BCRYPT_ROUNDS)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def get_password_hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    return pwd_context.needs_update(hashed_password)
+
+
+class HashingPool:
+    """Ограниченный пул процессов: при переполнении очереди запрос отклоняется сразу."""
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_pending = max_workers + max_queue
+        self.pending = 0
+        self.rejected = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def run(self, func: Callable, *args) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HashingPoolBusyException
+        self.pending += 1
+        try:
+            try:
+                return await self._submit(func, *args)
+            except BrokenProcessPool:
+                # Дочерний процесс погиб (OOM, сбой): пул уже пересоздан, вызов повторяется один раз
+                return await self._submit(func, *args)
+        finally:
+            self.pending -= 1
+
+    async def _submit(self, func: Callable, *args) -> Any:
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        except BrokenProcessPool:
+            # Сломанный пул больше не принимает задачи; его заменяет первый заметивший вызов
+            if self._executor is executor:
+                self._executor = None
+                executor.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {"workers": self.max_workers, "pending": self.pending, "max_pending": self.max_pending,
+                "rejected": self.rejected, "saturation": self.pending / self.max_pending}
+
+
+hashing_pool = HashingPool(max_workers=settings.HASHING_POOL_WORKERS, max_queue=settings.HASHING_POOL_MAX_QUEUE)
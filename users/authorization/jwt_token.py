@@ -26,5 +26,10 @@ def verify_jwt_token(token: str) -> str | None:
 
 
 def get_token(request: Request) -> str:
-    # достать значение ключа users_access_token из куки
-    return request.cookies.get('user_access_token')
+    # достать значение ключа users_access_token из куки, для API-клиентов - из заголовка Authorization
+    token = request.cookies.get('user_access_token')
+    if not token:
+        scheme, _, credentials = request.headers.get('authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and credentials:
+            token = credentials
+    return token
@@ -1,59 +1,64 @@
 import re
+import time
 from typing import Annotated
 
 from fastapi import HTTPException, Depends, Form
-from passlib.context import CryptContext
 from starlette import status
 
+from config import settings
+from monitoring.logs import bind_request
+from users.authorization.hashing import (hashing_pool, verify_password, get_password_hash,
+                                         password_needs_rehash)
 from users.authorization.jwt_token import verify_jwt_token, get_token
-from utilites.depends import get_user_dao
+from utilites.cache import user_cache
+from utilites.depends import get_async_user_dao
 from utilites.exceptions import (NotSamePasswordException, UsernamePasswordException,
                                  TokenExpiredException, UsernameExistsException)
 from users.schemas import UserCheck, UserInDB, FormDataCreate
-from db.sessions import AbstractDao
+from db.async_sessions import AsyncAbstractDao
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
-
-def get_user(login: str, dao: Annotated[AbstractDao, Depends()]) -> UserInDB:
-    user = dao.get_one(login)
+async def get_user(login: str, dao: Annotated[AsyncAbstractDao, Depends()]) -> UserInDB:
+    user = await dao.get_one(login)
     if user:
         return UserInDB(login=user.login, hashed_password=user.password, id=user.id)
 
 
-def authenticate_user(login: str, password: str, dao: Annotated[AbstractDao, Depends()]) -> UserCheck:
-    user = get_user(login, dao)
+async def authenticate_user(login: str, password: str, dao: Annotated[AsyncAbstractDao, Depends()]) -> UserCheck:
+    user = await get_user(login, dao)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    if not verify_password(password, user.hashed_password):
+    if not await hashing_pool.run(verify_password, password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
+    if password_needs_rehash(user.hashed_password):
+        hashed_password = await hashing_pool.run(get_password_hash, password)
+        await dao.update_password(user.login, hashed_password)
     return user
 
 
-def get_current_user(token: Annotated[str, Depends(get_token)],
-                     dao: Annotated[AbstractDao, Depends(get_user_dao)]) -> UserInDB:
+async def get_current_user(token: Annotated[str, Depends(get_token)],
+                           dao: Annotated[AsyncAbstractDao, Depends(get_async_user_dao)]) -> UserInDB:
     decoded_data = verify_jwt_token(token)
     if decoded_data == 'Token is expired':
         raise TokenExpiredException
     if not decoded_data:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Необходимо сначала авторизоваться")
-    user = dao.get_one(decoded_data["sub"])
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не найден")
+    user = await user_cache.get(decoded_data["sub"])
+    if user is None:
+        user = await get_user(decoded_data["sub"], dao)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не найден")
+        # Запись в кэше не переживает срок действия токена
+        ttl = min(settings.USER_CACHE_TTL, int(decoded_data["exp"] - time.time()))
+        if ttl > 0:
+            await user_cache.set(user.login, user, ttl=ttl)
+    bind_request(user=user.login)
     return user
 
 
-def validate_password_username(data: Annotated[FormDataCreate, Form()],
-                               dao: Annotated[AbstractDao, Depends()],
-                               errors: list = []) -> list:
+async def validate_password_username(data: Annotated[FormDataCreate, Form()],
+                                     dao: Annotated[AsyncAbstractDao, Depends()],
+                                     errors: list = []) -> list:
     # Регулярное выражение для проверки, что строка содержит только латинские символы и цифры
     if errors is not None:
         errors = []
@@ -63,6 +68,6 @@ def validate_password_username(data: Annotated[FormDataCreate, Form()],
         errors.append(UsernamePasswordException())
     elif data.password != data.repeated_password:
         errors.append(NotSamePasswordException())
-    elif dao.get_one(data.login):
+    elif await dao.get_one(data.login):
         errors.append(UsernameExistsException())
     return errors
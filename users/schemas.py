@@ -45,12 +45,26 @@ class LocationCheckUser(BaseModel):
     state: str = "-"
 
 
+class SavedLocation(BaseModel):
+    id: int
+    name: str
+    latitude: Decimal
+    longitude: Decimal
+    country: str
+    state: str = "-"
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class WeatherCheck(BaseModel):
     location_id: int
     name: str
-    main: str
-    temp: int
-    feels_like: int
-    wind_speed: int
+    main: str = 'Нет данных'
+    temp: int | None = None
+    feels_like: int | None = None
+    wind_speed: int | None = None
+    dt: int | None = None
+    # Возраст показания в секундах, если API недоступен и показано сохраненное значение
+    stale_age: int | None = None
     country: str
     state: str = '-'
@@ -0,0 +1,174 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any
+
+from loguru import logger
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+from transliterate import translit
+
+from config import settings
+
+_redis: aioredis.Redis | None = None
+
+
+def create_cache_redis() -> aioredis.Redis | None:
+    if not settings.REDIS_ENABLED:
+        return None
+    return aioredis.from_url(settings.REDIS_CONNECTION_URL, encoding="utf8", decode_responses=True,
+                             socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                             socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT)
+
+
+def set_cache_redis(redis: aioredis.Redis | None) -> None:
+    global _redis
+    _redis = redis
+
+
+def get_cache_redis() -> aioredis.Redis | None:
+    return _redis
+
+
+class TwoLevelCache:
+    """Кэш с TTL: LRU в памяти процесса перед общим для всех воркеров Redis.
+
+    При shared=False используется только LRU процесса, значения не сериализуются.
+    """
+
+    def __init__(self, namespace: str, ttl: int, maxsize: int, shared: bool = True):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.shared = shared
+        self._local: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _get_redis(self) -> aioredis.Redis | None:
+        return get_cache_redis() if self.shared else None
+
+    def _get_local(self, key: str) -> Any | None:
+        item = self._local.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._local[key]
+            return None
+        self._local.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Any, ttl: int) -> None:
+        self._local[key] = (time.monotonic() + ttl, value)
+        self._local.move_to_end(key)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+
+    async def get(self, key: str) -> Any | None:
+        value = self._get_local(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    raw_value, ttl = await pipe.get(self._redis_key(key)).ttl(self._redis_key(key)).execute()
+            except (RedisError, OSError) as e:
+                logger.warning("Кэш {namespace}: Redis недоступен ({error})", namespace=self.namespace, error=str(e))
+            else:
+                if raw_value is not None:
+                    value = json.loads(raw_value)
+                    self._set_local(key, value, ttl if ttl > 0 else self.ttl)
+                    self.redis_hits += 1
+                    return value
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: int | None = None) -> None:
+        ttl = ttl or self.ttl
+        self._set_local(key, value, ttl)
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                await redis.set(self._redis_key(key), json.dumps(value), ex=ttl)
+            except (RedisError, OSError) as e:
+                logger.warning("Кэш {namespace}: Redis недоступен ({error})", namespace=self.namespace, error=str(e))
+
+    async def delete(self, key: str) -> None:
+        self._local.pop(key, None)
+        redis = self._get_redis()
+        if redis is not None:
+            try:
+                await redis.delete(self._redis_key(key))
+            except (RedisError, OSError) as e:
+                logger.warning("Кэш {namespace}: Redis недоступен ({error})", namespace=self.namespace, error=str(e))
+
+    def clear(self) -> None:
+        self._local.clear()
+
+    def stats(self) -> dict:
+        hits = self.local_hits + self.redis_hits
+        total = hits + self.misses
+        return {"local_hits": self.local_hits, "redis_hits": self.redis_hits, "misses": self.misses,
+                "hit_ratio": hits / total if total else 0.0, "local_size": len(self._local)}
+
+
+class LocationViews:
+    """Время последнего просмотра погоды по ключам кэша, для приоритизации фонового обновления."""
+
+    redis_key = "weather:views"
+
+    def __init__(self, window: int):
+        self.window = window
+        self._local: dict[str, float] = {}
+
+    async def record(self, keys: list[str]) -> None:
+        now = time.time()
+        self._local.update(dict.fromkeys(keys, now))
+        redis = get_cache_redis()
+        if redis is not None and keys:
+            try:
+                async with redis.pipeline(transaction=False) as pipe:
+                    await (pipe.zadd(self.redis_key, dict.fromkeys(keys, now))
+                           .zremrangebyscore(self.redis_key, 0, now - self.window).execute())
+            except (RedisError, OSError) as e:
+                logger.warning("Просмотры локаций: Redis недоступен ({error})", error=str(e))
+
+    async def recent(self) -> dict[str, float]:
+        border = time.time() - self.window
+        self._local = {key: viewed_at for key, viewed_at in self._local.items() if viewed_at > border}
+        redis = get_cache_redis()
+        if redis is not None:
+            try:
+                views = await redis.zrangebyscore(self.redis_key, border, "+inf", withscores=True)
+            except (RedisError, OSError) as e:
+                logger.warning("Просмотры локаций: Redis недоступен ({error})", error=str(e))
+            else:
+                return {**self._local, **dict(views)}
+        return dict(self._local)
+
+
+def weather_cache_key(latitude, longitude, lang: str, units: str) -> str:
+    precision = settings.WEATHER_CACHE_PRECISION
+    return f"{float(latitude):.{precision}f}:{float(longitude):.{precision}f}:{lang}:{units}"
+
+
+def geocode_cache_key(city: str) -> str:
+    # "  Москва ", "москва" и "Moskva" дают один и тот же ключ
+    normalized_city = " ".join(city.split()).casefold()
+    return translit(normalized_city, language_code="ru", reversed=True).casefold()
+
+
+weather_cache = TwoLevelCache("weather", ttl=settings.WEATHER_CACHE_TTL, maxsize=settings.WEATHER_CACHE_LOCAL_SIZE)
+# Последнее известное показание на случай недоступности API; хранится дольше основного кэша
+weather_stale_cache = TwoLevelCache("weather_stale", ttl=settings.WEATHER_STALE_TTL,
+                                    maxsize=settings.WEATHER_CACHE_LOCAL_SIZE)
+geocode_cache = TwoLevelCache("geocode", ttl=settings.GEOCODE_CACHE_TTL, maxsize=settings.GEOCODE_CACHE_LOCAL_SIZE)
+location_views = LocationViews(window=settings.WEATHER_PREFETCH_RECENT_WINDOW)
+user_cache = TwoLevelCache("user", ttl=settings.USER_CACHE_TTL, maxsize=settings.USER_CACHE_LOCAL_SIZE, shared=False)
@@ -0,0 +1,123 @@
+# Сжатие динамических ответов: brotli (если установлен пакет brotli) или gzip
+
+import zlib
+from importlib.util import find_spec
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+BROTLI_AVAILABLE = find_spec("brotli") is not None
+if BROTLI_AVAILABLE:
+    import brotli
+
+# Картинки и архивы уже сжаты
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+class GzipCompressor:
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+class BrotliCompressor:
+
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def process(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    accepted = {item.split(";")[0].strip() for item in accept_encoding.lower().split(",")
+                if not item.replace(" ", "").endswith(";q=0")}
+    if BROTLI_AVAILABLE and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def weaken_etag(headers: MutableHeaders) -> None:
+    # Сжатое представление отличается побайтно, поэтому ETag становится слабым
+    if headers.get("etag", "").startswith('"'):
+        headers["ETag"] = f"W/{headers['etag']}"
+
+
+class CompressionMiddleware:
+    """Сжимает ответы текстовых типов от minimum_size байт, в т.ч. потоковые.
+
+    Ответы, у которых уже есть Content-Encoding (например, предсжатая статика), не трогаются.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 5):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = None
+        if scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        compressor = None
+        start_message: Message = {}
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal compressor, start_message
+            if message["type"] == "http.response.start":
+                if message["status"] == 304:
+                    # 304 подтверждает сжатую копию клиента, ETag должен совпасть с выданным вместе с ней
+                    weaken_etag(MutableHeaders(raw=message["headers"]))
+                    await send(message)
+                    return
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            if start_message:
+                body = message.get("body", b"")
+                more_body = message.get("more_body", False)
+                headers = MutableHeaders(raw=start_message["headers"])
+                content_type = headers.get("content-type", "")
+                if ("content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES)
+                        or (len(body) < self.minimum_size and not more_body)):
+                    await send(start_message)
+                    start_message = {}
+                    await send(message)
+                    return
+                compressor = (BrotliCompressor(self.brotli_quality) if encoding == "br"
+                              else GzipCompressor(self.gzip_level))
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                weaken_etag(headers)
+                del headers["Content-Length"]
+                compressed = compressor.process(body) + (b"" if more_body else compressor.finish())
+                if not more_body:
+                    headers["Content-Length"] = str(len(compressed))
+                await send(start_message)
+                start_message = {}
+                await send({**message, "body": compressed})
+                return
+            if compressor is None:
+                await send(message)
+                return
+            more_body = message.get("more_body", False)
+            compressed = compressor.process(message.get("body", b"")) + (b"" if more_body else compressor.finish())
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
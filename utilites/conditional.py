@@ -0,0 +1,39 @@
+# Условные ответы: ETag, If-None-Match и 304 без тела
+
+import hashlib
+
+import orjson
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import Response
+
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def compute_etag(body: bytes) -> str:
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def compute_data_etag(*parts) -> str:
+    # ETag по данным страницы, чтобы проверить If-None-Match до рендеринга шаблона; побайтное
+    # совпадение разметки не гарантируется, поэтому ETag слабый
+    return f"W/{compute_etag(orjson.dumps(parts))}"
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    # If-None-Match: "a", W/"b" или *; слабые ETag сравниваются без префикса W/
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+def cache_headers(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> dict:
+    # Страницы зависят от куки пользователя
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": "Cookie, Authorization"}
+
+
+def not_modified_response(etag: str, cache_control: str = PRIVATE_REVALIDATE) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag, cache_control))
@@ -1,16 +1,17 @@
+from db.async_sessions import AsyncUserDao, AsyncLocationDao
+from db.engine import get_async_session_factory
 from db.two_dao_shema import TwoDaoHelper
 from db.models import User, Location
-from db.sessions import UserDao, LocationDao
 from locations.location_service import LocationService
 from weather_service import WeatherApiService
 
 
-def get_user_dao() -> UserDao:
-    return UserDao(model=User)
+def get_async_user_dao() -> AsyncUserDao:
+    return AsyncUserDao(model=User, session_factory=get_async_session_factory())
 
 
-def get_location_dao() -> LocationDao:
-    return LocationDao(model=Location)
+def get_async_location_dao() -> AsyncLocationDao:
+    return AsyncLocationDao(model=Location, session_factory=get_async_session_factory())
 
 
 def get_weather_service() -> WeatherApiService:
@@ -22,4 +23,4 @@ def get_location_service() -> LocationService:
 
 
 def get_two_dao() -> TwoDaoHelper:
-    return TwoDaoHelper(user=UserDao(model=User), location=LocationDao(model=Location))
+    return TwoDaoHelper(user=get_async_user_dao(), location=get_async_location_dao())
@@ -38,6 +38,24 @@ class OpenWeatherApiException(ExceptionWithMessage):
         super().__init__(status_code=500, detail='Ошибка API OpenWeather')
 
 
+class OpenWeatherRateLimitException(OpenWeatherApiException):
+    def __init__(self):
+        super().__init__()
+        self.detail = 'Превышен лимит запросов к API OpenWeather'
+
+
+class OpenWeatherUnavailableException(OpenWeatherApiException):
+    def __init__(self):
+        super().__init__()
+        self.status_code = 503
+        self.detail = 'API OpenWeather временно недоступен'
+
+
+class HashingPoolBusyException(ExceptionWithMessage):
+    def __init__(self):
+        super().__init__(status_code=503, detail='Сервер перегружен, попробуйте позже')
+
+
 class TokenExpiredException(ExceptionWithMessage):
     def __init__(self):
         super().__init__(status_code=401, detail='Token is expired (180 min)')
@@ -0,0 +1,49 @@
+from importlib.util import find_spec
+
+import anyio
+import httpx
+
+from config import settings
+
+# HTTP/2 доступен только при установленном пакете h2
+HTTP2_AVAILABLE = find_spec("h2") is not None
+
+_client: httpx.AsyncClient | None = None
+
+
+def create_http_client(transport: httpx.AsyncBaseTransport | None = None) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=settings.WEATHER_API_POOL_SIZE,
+                          max_keepalive_connections=settings.WEATHER_API_POOL_SIZE,
+                          keepalive_expiry=settings.WEATHER_API_KEEPALIVE_EXPIRY)
+    timeout = httpx.Timeout(settings.WEATHER_API_READ_TIMEOUT,
+                            connect=settings.WEATHER_API_CONNECT_TIMEOUT)
+    return httpx.AsyncClient(limits=limits, timeout=timeout, transport=transport,
+                             http2=settings.WEATHER_API_HTTP2 and HTTP2_AVAILABLE)
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_http_client()
+    return _client
+
+
+def set_http_client(client: httpx.AsyncClient | None) -> None:
+    global _client
+    _client = client
+
+
+async def init_http_client() -> httpx.AsyncClient:
+    # Создание клиента - в основном загрузка сертификатов в SSL-контекст (~100 мс), поэтому в потоке.
+    # Уже заданный клиент (например, в тестах) не пересоздается
+    global _client
+    if _client is None or _client.is_closed:
+        _client = await anyio.to_thread.run_sync(create_http_client)
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
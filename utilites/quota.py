@@ -0,0 +1,116 @@
+# Квота запросов к OpenWeather: токен-бакет в Redis, общий для всех воркеров, с классами приоритета
+
+import asyncio
+import time
+from enum import Enum
+
+from loguru import logger
+from redis.exceptions import RedisError
+
+from config import settings
+from utilites.cache import get_cache_redis
+from utilites.exceptions import OpenWeatherRateLimitException
+
+# Пополнение бакета и попытка взять токен атомарно; floor - сколько токенов оставить более важным запросам
+TAKE_TOKEN_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local floor = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local state = redis.call("HMGET", KEYS[1], "tokens", "ts")
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens - 1 >= floor then
+    tokens = tokens - 1
+    allowed = 1
+else
+    wait = (floor + 1 - tokens) / rate
+end
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "ts", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {allowed, tostring(tokens), tostring(wait)}
+"""
+
+
+class Priority(str, Enum):
+    INTERACTIVE = "interactive"
+    GEOCODE = "geocode"
+    BACKGROUND = "background"
+
+
+# Доля бакета, которую класс не может израсходовать, и сколько он готов ждать токен
+PRIORITY_RESERVE = {Priority.INTERACTIVE: 0.0, Priority.GEOCODE: 0.1, Priority.BACKGROUND: 0.5}
+PRIORITY_MAX_WAIT = {Priority.INTERACTIVE: settings.WEATHER_QUOTA_MAX_WAIT,
+                     Priority.GEOCODE: settings.WEATHER_QUOTA_MAX_WAIT, Priority.BACKGROUND: 0.0}
+
+
+class QuotaManager:
+    """Токен-бакет на calls_per_minute вызовов: емкость - минутная квота, пополнение равномерное.
+
+    Фоновые запросы берут токены, только пока бакет заполнен больше чем наполовину, и не ждут:
+    при нехватке сразу получают OpenWeatherRateLimitException. Без Redis бакет локальный для процесса,
+    и каждый из processes воркеров получает свою долю квоты, чтобы вместе они не превысили лимит ключа.
+    """
+
+    def __init__(self, name: str, calls_per_minute: int, enabled: bool = True, processes: int = 1):
+        self.key = f"quota:{name}"
+        self.capacity = calls_per_minute
+        self.rate = calls_per_minute / 60
+        self.local_capacity = calls_per_minute / processes
+        self.local_rate = self.rate / processes
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self) -> None:
+        self.tokens = float(self.local_capacity)
+        self._updated_at = time.time()
+        self.granted = {priority: 0 for priority in Priority}
+        self.denied = {priority: 0 for priority in Priority}
+
+    def _take_local(self, floor: float, now: float) -> tuple[bool, float, float]:
+        self.tokens = min(self.local_capacity, self.tokens + max(0.0, now - self._updated_at) * self.local_rate)
+        self._updated_at = now
+        if self.tokens - 1 >= floor:
+            self.tokens -= 1
+            return True, self.tokens, 0.0
+        return False, self.tokens, (floor + 1 - self.tokens) / self.local_rate
+
+    async def _take(self, reserve: float) -> tuple[bool, float, float]:
+        now = time.time()
+        redis = get_cache_redis()
+        if redis is not None:
+            try:
+                allowed, tokens, wait = await redis.eval(TAKE_TOKEN_SCRIPT, 1, self.key, self.rate,
+                                                         self.capacity, self.capacity * reserve, now)
+                self.tokens = float(tokens)
+                return bool(allowed), self.tokens, float(wait)
+            except (RedisError, OSError) as e:
+                logger.warning("Квота {key}: Redis недоступен ({error}), используется локальный бакет", key=self.key,
+                               error=str(e))
+        return self._take_local(self.local_capacity * reserve, now)
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE) -> None:
+        if not self.enabled:
+            return
+        deadline = time.monotonic() + PRIORITY_MAX_WAIT[priority]
+        while True:
+            allowed, _, wait = await self._take(PRIORITY_RESERVE[priority])
+            if allowed:
+                self.granted[priority] += 1
+                return
+            if time.monotonic() + wait > deadline:
+                self.denied[priority] += 1
+                raise OpenWeatherRateLimitException
+            await asyncio.sleep(wait)
+
+    def stats(self) -> dict:
+        return {"capacity": self.capacity, "tokens": self.tokens,
+                "granted": {priority.value: count for priority, count in self.granted.items()},
+                "denied": {priority.value: count for priority, count in self.denied.items()}}
+
+
+openweather_quota = QuotaManager("openweather", calls_per_minute=settings.WEATHER_API_CALLS_PER_MINUTE,
+                                 enabled=settings.WEATHER_QUOTA_ENABLED, processes=settings.WEB_CONCURRENCY)
@@ -0,0 +1,71 @@
+# Устойчивость к сбоям OpenWeather: предохранитель (circuit breaker) и задержки между повторами
+
+import random
+import time
+
+from config import settings
+
+
+class CircuitBreaker:
+    """После failure_threshold ошибок подряд вызовы отклоняются без обращения к API (open).
+
+    Через recovery_timeout пропускается один пробный вызов (half-open): успех закрывает
+    предохранитель, ошибка снова открывает его.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.reset()
+
+    def reset(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_total = 0
+        self._probe_started = None
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # Пробный вызов, который не завершился (например, отменен), не блокирует следующий
+            now = time.monotonic()
+            if self._probe_started is not None and now - self._probe_started < self.recovery_timeout:
+                return False
+            self._probe_started = now
+        return self.state != self.OPEN
+
+    def release_probe(self) -> None:
+        # Вызов отменен до обращения к API (например, не хватило квоты), следующий может быть пробным
+        self._probe_started = None
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened_total += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+        self._probe_started = None
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self.failures, "opened_total": self.opened_total}
+
+
+def retry_delay(attempt: int, base: float = settings.WEATHER_API_RETRY_BACKOFF,
+                cap: float = settings.WEATHER_API_RETRY_BACKOFF_MAX) -> float:
+    # Экспоненциальная задержка с полным джиттером, чтобы воркеры не повторяли запросы одновременно
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+openweather_breaker = CircuitBreaker("openweather", failure_threshold=settings.WEATHER_BREAKER_FAILURE_THRESHOLD,
+                                     recovery_timeout=settings.WEATHER_BREAKER_RECOVERY_TIMEOUT)
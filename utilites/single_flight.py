@@ -0,0 +1,103 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from loguru import logger
+from redis.exceptions import RedisError
+
+from config import settings
+from utilites.cache import get_cache_redis
+
+# Удаление блокировки только ее владельцем
+RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Объединяет одновременные вызовы с одинаковым ключом в один запрос к API.
+
+    Внутри процесса ожидающие получают результат или ошибку общего вызова. В режиме
+    redis_lock воркеры дополнительно координируются через блокировку в Redis: пока
+    один воркер обращается к API, остальные ждут и берут результат из общего кэша.
+    """
+
+    def __init__(self, namespace: str, redis_lock: bool = settings.SINGLE_FLIGHT_REDIS_LOCK,
+                 lock_timeout: float = settings.SINGLE_FLIGHT_LOCK_TIMEOUT,
+                 wait_timeout: float = settings.SINGLE_FLIGHT_WAIT_TIMEOUT):
+        self.namespace = namespace
+        self.redis_lock = redis_lock
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self._calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]],
+                 cached: Callable[[], Awaitable[Any]] | None = None) -> Any:
+        future = self._calls.get(key)
+        if future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # Отменен запрос ведущего, а не этот: вызов повторяется, один из ожидающих становится ведущим
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.do(key, func, cached)
+                raise
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await self._call(key, func, cached)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # Ошибка передается ожидающим, предупреждение о непрочитанном исключении не нужно
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+    async def _call(self, key: str, func: Callable[[], Awaitable[Any]],
+                    cached: Callable[[], Awaitable[Any]] | None) -> Any:
+        redis = get_cache_redis()
+        if not self.redis_lock or redis is None or cached is None:
+            return await func()
+        lock_key, token = f"lock:{self.namespace}:{key}", uuid.uuid4().hex
+        try:
+            acquired = await redis.set(lock_key, token, nx=True, px=int(self.lock_timeout * 1000))
+        except (RedisError, OSError) as e:
+            logger.warning("Single-flight {namespace}: Redis недоступен ({error})",
+                           namespace=self.namespace, error=str(e))
+            return await func()
+        if acquired:
+            try:
+                return await func()
+            finally:
+                try:
+                    await redis.eval(RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+                except (RedisError, OSError) as e:
+                    logger.warning("Single-flight {namespace}: Redis недоступен ({error})",
+                                   namespace=self.namespace, error=str(e))
+        # Другой воркер уже обращается к API: ждем снятия блокировки и читаем кэш
+        deadline = time.monotonic() + self.wait_timeout
+        try:
+            while time.monotonic() < deadline and await redis.exists(lock_key):
+                await asyncio.sleep(0.05)
+        except (RedisError, OSError) as e:
+            logger.warning("Single-flight {namespace}: Redis недоступен ({error})",
+                           namespace=self.namespace, error=str(e))
+        result = await cached()
+        if result is not None:
+            return result
+        return await func()
+
+
+weather_flight = SingleFlight("weather")
+geocode_flight = SingleFlight("geocode")
@@ -0,0 +1,68 @@
+# Раздача собранной статики (utilites/static_build.py) и ссылки на файлы с хэшем в имени для шаблонов
+
+import json
+import stat
+from mimetypes import guess_type
+from pathlib import Path
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from config import settings
+from utilites.static_build import MANIFEST_NAME
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+
+def load_manifest(directory: str = settings.STATIC_BUILD_DIR) -> dict:
+    path = Path(directory) / MANIFEST_NAME
+    return json.loads(path.read_text()) if path.is_file() else {}
+
+
+manifest = load_manifest()
+
+
+def static_url(path: str) -> str:
+    # Без сборки (разработка) ссылки ведут на исходные файлы
+    path = path.lstrip("/")
+    return f"/static/{manifest.get(path, path)}"
+
+
+class FingerprintedStaticFiles(StaticFiles):
+    """Отдает предсжатые копии (.br/.gz) и кэширует файлы с хэшем в имени на год."""
+
+    def __init__(self, *args, fingerprinted: set[str] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fingerprinted = fingerprinted or set()
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await self._get_precompressed(path, scope) or await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE if path in self.fingerprinted else REVALIDATE
+        return response
+
+    async def _get_precompressed(self, path: str, scope: Scope) -> Response | None:
+        if scope["method"] not in ("GET", "HEAD"):
+            return None
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accept_encoding:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                response = FileResponse(full_path, stat_result=stat_result, media_type=guess_type(path)[0],
+                                        headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+                if self.is_not_modified(response.headers, Headers(scope=scope)):
+                    return Response(status_code=304, headers={"ETag": response.headers["etag"]})
+                return response
+        return None
+
+
+def create_static_files() -> StaticFiles:
+    if manifest:
+        return FingerprintedStaticFiles(directory=settings.STATIC_BUILD_DIR, fingerprinted=set(manifest.values()))
+    return StaticFiles(directory="static")
@@ -0,0 +1,65 @@
+# Сборка статики: имена с хэшем содержимого, предсжатые .gz/.br и манифест для шаблонов.
+# Не зависит от настроек приложения, поэтому запускается при сборке образа:
+# python -m utilites.static_build [--source static] [--output static_build]
+
+import argparse
+import gzip
+import hashlib
+import json
+import shutil
+from mimetypes import guess_type
+from pathlib import Path
+
+from utilites.compression import BROTLI_AVAILABLE, COMPRESSIBLE_TYPES
+
+if BROTLI_AVAILABLE:
+    import brotli
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_OUTPUT = "static_build"
+
+
+def fingerprinted_name(path: Path, content: bytes) -> str:
+    return f"{path.stem}.{hashlib.blake2b(content, digest_size=6).hexdigest()}{path.suffix}"
+
+
+def precompress(path: Path, content: bytes) -> None:
+    # Сжатая копия сохраняется, только если она заметно меньше оригинала
+    variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if BROTLI_AVAILABLE:
+        variants[".br"] = brotli.compress(content, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(content) * 0.9:
+            path.with_name(path.name + suffix).write_bytes(compressed)
+
+
+def build_static(source: str = "static", output: str = DEFAULT_OUTPUT) -> dict:
+    source_dir, output_dir = Path(source), Path(output)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    manifest = {}
+    for path in sorted(item for item in source_dir.rglob("*") if item.is_file()):
+        relative = path.relative_to(source_dir)
+        content = path.read_bytes()
+        hashed = relative.with_name(fingerprinted_name(relative, content))
+        manifest[relative.as_posix()] = hashed.as_posix()
+        # Исходное имя тоже копируется: на него могут ссылаться старые страницы и внешние ссылки
+        for target in (output_dir / relative, output_dir / hashed):
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(content)
+            if (guess_type(path.name)[0] or "").startswith(COMPRESSIBLE_TYPES):
+                precompress(target, content)
+    (output_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress static files")
+    parser.add_argument("--source", default="static")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+    built = build_static(args.source, args.output)
+    print(f"{len(built)} files -> {args.output}/{MANIFEST_NAME}")
+
+
+if __name__ == "__main__":
+    main()
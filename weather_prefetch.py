@@ -0,0 +1,138 @@
+import asyncio
+import random
+from uuid import uuid4
+
+from loguru import logger
+from redis.exceptions import RedisError
+
+from config import settings
+from db.models import Location
+from db.async_sessions import AsyncLocationDao
+from db.engine import dispose_db
+from utilites.cache import create_cache_redis, get_cache_redis, location_views, set_cache_redis, weather_cache_key
+from utilites.exceptions import OpenWeatherApiException, OpenWeatherRateLimitException
+from utilites.http_client import init_http_client, close_http_client
+from utilites.quota import Priority
+from utilites.single_flight import RELEASE_LOCK_SCRIPT
+from weather_service import WeatherApiService
+
+
+LEADER_KEY = "weather:prefetch:leader"
+# Запас аренды сверх интервала на задержки цикла
+LEASE_MARGIN = 30
+
+# Захват свободной аренды или продление своей; чужая аренда не трогается
+RENEW_LEASE_SCRIPT = """
+local owner = redis.call("get", KEYS[1])
+if not owner then
+    redis.call("set", KEYS[1], ARGV[1], "PX", ARGV[2])
+    return 1
+end
+if owner == ARGV[1] then
+    redis.call("pexpire", KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+
+class WeatherPrefetcher:
+    """Периодически обновляет в общем кэше погоду для всех сохраненных координат.
+
+    Из всех воркеров и процессов цикл выполняет один - владелец аренды в Redis. Без Redis цикл идет в каждом процессе.
+    """
+
+    def __init__(self, weather_service: WeatherApiService, location_dao: AsyncLocationDao,
+                 interval: int = settings.WEATHER_PREFETCH_INTERVAL,
+                 calls_per_minute: int = settings.WEATHER_PREFETCH_CALLS_PER_MINUTE,
+                 jitter: float = settings.WEATHER_PREFETCH_JITTER):
+        self.weather_service = weather_service
+        self.location_dao = location_dao
+        self.interval = interval
+        self.call_delay = 60 / calls_per_minute
+        self.jitter = jitter
+        self.owner = uuid4().hex
+        # Аренда переживает самую длинную паузу между циклами с запасом и продлевается в ходе цикла
+        self.lease_ms = int((self.interval * (1 + self.jitter) + LEASE_MARGIN) * 1000)
+
+    def _jittered(self, delay: float) -> float:
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def acquire_lease(self) -> bool:
+        redis = get_cache_redis()
+        if redis is None:
+            return True
+        try:
+            return bool(await redis.eval(RENEW_LEASE_SCRIPT, 1, LEADER_KEY, self.owner, self.lease_ms))
+        except (RedisError, OSError) as e:
+            logger.warning("Фоновое обновление погоды: Redis недоступен ({error}), цикл пропущен", error=str(e))
+        return False
+
+    async def release_lease(self) -> None:
+        # При остановке воркера аренда освобождается сразу, ее подхватывает следующий цикл другого воркера
+        redis = get_cache_redis()
+        if redis is None:
+            return
+        try:
+            await redis.eval(RELEASE_LOCK_SCRIPT, 1, LEADER_KEY, self.owner)
+        except (RedisError, OSError) as e:
+            logger.warning("Фоновое обновление погоды: Redis недоступен ({error})", error=str(e))
+
+    async def get_coordinates(self) -> list:
+        coordinates = {}
+        for latitude, longitude in await self.location_dao.get_distinct_coordinates():
+            coordinates.setdefault(weather_cache_key(latitude, longitude, lang="ru", units="metric"),
+                                   (latitude, longitude))
+        # Недавно просмотренные локации обновляются первыми
+        recent_views = await location_views.recent()
+        ordered_keys = sorted(coordinates, key=lambda key: recent_views.get(key, 0), reverse=True)
+        return [coordinates[key] for key in ordered_keys]
+
+    async def run_once(self) -> int:
+        refreshed = 0
+        for latitude, longitude in await self.get_coordinates():
+            try:
+                await self.weather_service.refresh_weather_for_location(latitude, longitude,
+                                                                        priority=Priority.BACKGROUND)
+                refreshed += 1
+            except OpenWeatherRateLimitException:
+                logger.warning("Фоновое обновление погоды: достигнут лимит API, цикл прерван")
+                break
+            except OpenWeatherApiException as e:
+                logger.warning("Фоновое обновление погоды для {latitude}, {longitude}: {detail}", latitude=latitude,
+                               longitude=longitude, detail=e.detail)
+            await asyncio.sleep(self._jittered(self.call_delay))
+            # Длинный цикл продлевает аренду; если ее перехватил другой воркер, цикл прерывается
+            if not await self.acquire_lease():
+                break
+        return refreshed
+
+    async def run_forever(self) -> None:
+        try:
+            while True:
+                try:
+                    if await self.acquire_lease():
+                        refreshed = await self.run_once()
+                        logger.info("Фоновое обновление погоды: обновлено локаций {refreshed}", refreshed=refreshed)
+                except Exception as e:
+                    logger.exception("Фоновое обновление погоды завершилось ошибкой: {error}", error=str(e))
+                await asyncio.sleep(self._jittered(self.interval))
+        finally:
+            await self.release_lease()
+
+
+async def main() -> None:
+    redis = create_cache_redis()
+    set_cache_redis(redis)
+    client = await init_http_client()
+    try:
+        await WeatherPrefetcher(WeatherApiService(client), AsyncLocationDao(model=Location)).run_forever()
+    finally:
+        await close_http_client()
+        await dispose_db()
+        if redis is not None:
+            await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,65 +1,274 @@
+import asyncio
+import time
 from decimal import Decimal
+from typing import Any
 
+import httpx
+from loguru import logger
 from transliterate import translit
-import requests
 
 from config import settings
-from utilites.exceptions import OpenWeatherApiException, NotCityException
+from gazetteer import gazetteer
+from monitoring.logs import record_upstream
+from monitoring.metrics import UPSTREAM_ERRORS, UPSTREAM_LATENCY
+from utilites.cache import (geocode_cache, geocode_cache_key, location_views, weather_cache, weather_cache_key,
+                            weather_stale_cache)
+from utilites.exceptions import (OpenWeatherApiException, OpenWeatherRateLimitException,
+                                 OpenWeatherUnavailableException, NotCityException)
+from utilites.http_client import get_http_client
+from utilites.quota import Priority, openweather_quota
+from utilites.resilience import openweather_breaker, retry_delay
+from utilites.single_flight import geocode_flight, weather_flight
 from users.schemas import LocationCheck, WeatherCheck
 
+# Общий для всех запросов процесса лимит одновременных обращений к API погоды
+_global_semaphore: asyncio.Semaphore | None = None
+
+
+def get_global_semaphore() -> asyncio.Semaphore:
+    global _global_semaphore
+    if _global_semaphore is None:
+        _global_semaphore = asyncio.Semaphore(settings.WEATHER_GLOBAL_CONCURRENCY)
+    return _global_semaphore
+
 
 class WeatherApiService:
 
-    def __init__(self):
+    def __init__(self, client: httpx.AsyncClient | None = None):
         self.api_key = settings.WEATHER_API_KEY
-        self.find_locations_url = "https://api.openweathermap.org/geo/1.0/direct"
-        self.get_weather_url = "https://api.openweathermap.org/data/2.5/weather"
+        self.client = client or get_http_client()
+        self.find_locations_url = f"{settings.WEATHER_API_URL}/geo/1.0/direct"
+        self.get_weather_url = f"{settings.WEATHER_API_URL}/data/2.5/weather"
+        self.get_group_weather_url = f"{settings.WEATHER_API_URL}/data/2.5/group"
 
-    def find_locations_by_name(self, city: str) -> list:
-        if not city:
-            raise NotCityException
-        city = city[0].upper() + city[1:]
-        found_locations = requests.get(self.find_locations_url,
-                                       params={"q": city, "appid": self.api_key, "limit": 5, "lang": "ru"})
-        if "cod" in found_locations and "message" in found_locations:
+    async def _request(self, url: str, params: dict, endpoint: str) -> httpx.Response | None:
+        # None - сетевая ошибка или таймаут, запрос можно повторить
+        started = time.perf_counter()
+        try:
+            return await self.client.get(url, params=params)
+        except httpx.HTTPError as e:
+            UPSTREAM_ERRORS.labels(endpoint, type(e).__name__).inc()
+            return None
+        finally:
+            elapsed = time.perf_counter() - started
+            UPSTREAM_LATENCY.labels(endpoint).observe(elapsed)
+            record_upstream(endpoint, elapsed)
+
+    async def _get_json(self, url: str, params: dict, endpoint: str,
+                        priority: Priority = Priority.INTERACTIVE) -> Any:
+        # Все запросы к API - GET, поэтому сетевые ошибки и ответы 5xx повторяются в пределах общего срока
+        if not openweather_breaker.allow():
+            UPSTREAM_ERRORS.labels(endpoint, "circuit_open").inc()
+            raise OpenWeatherUnavailableException
+        try:
+            async with asyncio.timeout(settings.WEATHER_API_DEADLINE):
+                for attempt in range(settings.WEATHER_API_RETRIES + 1):
+                    if attempt:
+                        await asyncio.sleep(retry_delay(attempt - 1))
+                    await openweather_quota.acquire(priority)
+                    response = await self._request(url, params, endpoint)
+                    if response is not None and response.status_code < 500:
+                        break
+                    if response is not None:
+                        UPSTREAM_ERRORS.labels(endpoint, str(response.status_code)).inc()
+                else:
+                    # Предохранитель считает вызовы, а не попытки: одна ошибка после всех повторов
+                    openweather_breaker.record_failure()
+                    raise OpenWeatherApiException
+        except TimeoutError:
+            UPSTREAM_ERRORS.labels(endpoint, "deadline").inc()
+            openweather_breaker.record_failure()
+            raise OpenWeatherApiException
+        except OpenWeatherRateLimitException:
+            # Квота не пустила запрос к API: пробный вызов полуоткрытого предохранителя не состоялся
+            openweather_breaker.release_probe()
+            raise
+        if not response.is_error:
+            try:
+                data = response.json()
+            except ValueError:
+                UPSTREAM_ERRORS.labels(endpoint, "invalid_json").inc()
+                openweather_breaker.record_failure()
+                raise OpenWeatherApiException
+        # Ответ получен - API доступен, даже если запрос отклонен (4xx)
+        openweather_breaker.record_success()
+        if response.is_error:
+            UPSTREAM_ERRORS.labels(endpoint, str(response.status_code)).inc()
+            if response.status_code == 429:
+                raise OpenWeatherRateLimitException
             raise OpenWeatherApiException
-        deserialized_locations = found_locations.json()
-        target_locations = self.filter_locations(deserialized_locations, city)
+        return data
+
+    async def find_locations_by_name(self, city: str) -> list:
+        if not city or not city.strip():
+            raise NotCityException
+        cache_key = geocode_cache_key(city)
+        target_locations = await geocode_cache.get(cache_key)
+        if target_locations is None:
+            # Город уже есть в локальном справочнике - geo API не нужен
+            target_locations = gazetteer.lookup(city) or None
+        if target_locations is None:
+            target_locations = await geocode_flight.do(cache_key, lambda: self._find_locations(city, cache_key),
+                                                       cached=lambda: geocode_cache.get(cache_key))
         return [LocationCheck(**location) for location in target_locations]
 
+    async def _find_locations(self, city: str, cache_key: str) -> list:
+        city = city.strip()
+        city = city[0].upper() + city[1:]
+        deserialized_locations = await self._get_json(self.find_locations_url,
+                                                      params={"q": city, "appid": self.api_key,
+                                                              "limit": 5, "lang": "ru"}, endpoint="geo",
+                                                      priority=Priority.GEOCODE)
+        if settings.GAZETTEER_LEARN:
+            gazetteer.add_geocode_results(deserialized_locations)
+        target_locations = [LocationCheck(**location).model_dump(mode="json")
+                            for location in self.filter_locations(deserialized_locations, city)]
+        await geocode_cache.set(cache_key, target_locations,
+                                ttl=None if target_locations else settings.GEOCODE_NEGATIVE_CACHE_TTL)
+        return target_locations
+
     @staticmethod
     def filter_locations(deserialized_locations: list, city: str) -> list:
         target_locations = []
+        first_letter = translit(city[0], language_code='ru', reversed=True)
         for location in deserialized_locations:
-            if "local_names" in location:
-                if any([city in value for value in location["local_names"].values()]):
-                    if location["local_names"].get("ru", None):
-                        location['name'] = location['local_names']["ru"]
-                del location["local_names"]
-            if city in location["name"] or translit(city[0], language_code='ru', reversed=True) in location["name"]:
+            local_names = location.pop("local_names", None)
+            if local_names and local_names.get("ru") and any(city in value for value in local_names.values()):
+                location['name'] = local_names["ru"]
+            if city in location["name"] or first_letter in location["name"]:
                 target_locations.append(location)
         return target_locations
 
-    def get_weather_for_location(self, latitude: Decimal, longitude: Decimal) -> dict:
-        weather = requests.get(self.get_weather_url,
-                               params={"lat": latitude, "lon": longitude, "appid": self.api_key, "lang": "ru",
-                                       "units": "metric"})
-        if "cod" in weather and "message" in weather:
-            raise OpenWeatherApiException
-        return weather.json()
+    async def get_weather_for_location(self, latitude: Decimal, longitude: Decimal) -> dict:
+        cache_key = weather_cache_key(latitude, longitude, lang="ru", units="metric")
+        weather = await weather_cache.get(cache_key)
+        if weather is None:
+            weather = await weather_flight.do(cache_key,
+                                              lambda: self.refresh_weather_for_location(latitude, longitude),
+                                              cached=lambda: weather_cache.get(cache_key))
+        return weather
+
+    async def refresh_weather_for_location(self, latitude: Decimal, longitude: Decimal,
+                                           priority: Priority = Priority.INTERACTIVE) -> dict:
+        weather = await self._get_json(self.get_weather_url,
+                                       params={"lat": latitude, "lon": longitude, "appid": self.api_key,
+                                               "lang": "ru", "units": "metric"}, endpoint="weather",
+                                       priority=priority)
+        await self.store_weather(latitude, longitude, weather)
+        return weather
 
-    def get_user_locations_with_weather(self, user_locations: list) -> list:
-        locations_with_weather = []
+    @staticmethod
+    async def store_weather(latitude: Decimal, longitude: Decimal, weather: dict) -> None:
+        cache_key = weather_cache_key(latitude, longitude, lang="ru", units="metric")
+        await weather_cache.set(cache_key, weather)
+        await weather_stale_cache.set(cache_key, {"fetched_at": time.time(), "weather": weather})
+
+    @staticmethod
+    async def get_stale_weather(latitude: Decimal, longitude: Decimal) -> tuple[dict, int] | None:
+        # Последнее показание и его возраст в секундах
+        stale = await weather_stale_cache.get(weather_cache_key(latitude, longitude, lang="ru", units="metric"))
+        if stale is None:
+            return None
+        return stale["weather"], int(time.time() - stale["fetched_at"])
+
+    async def get_group_weather(self, locations: list) -> dict:
+        # Один запрос /group на пачку до WEATHER_BATCH_SIZE городов; результат - {location.id: погода}
+        city_ids = sorted({location.city_id for location in locations})
+        deserialized_weather = await self._get_json(self.get_group_weather_url,
+                                                    params={"id": ",".join(map(str, city_ids)),
+                                                            "appid": self.api_key, "lang": "ru",
+                                                            "units": "metric"}, endpoint="group")
+        weather_by_city = {weather["id"]: weather for weather in deserialized_weather.get("list", [])}
+        weather_by_location = {}
+        for location in locations:
+            weather = weather_by_city.get(location.city_id)
+            if weather is not None:
+                await self.store_weather(location.latitude, location.longitude, weather)
+                weather_by_location[location.id] = weather
+        return weather_by_location
+
+    async def get_batched_weather(self, user_locations: list) -> dict:
+        weather_by_location = {}
+        missing = []
         for location in user_locations:
-            weather_dict = self.get_weather_for_location(latitude=location.latitude,
-                                                         longitude=location.longitude)
-            weather_obj = WeatherCheck(main=weather_dict["weather"][0]["description"].capitalize(),
-                                       temp=round(weather_dict["main"]["temp"], 0),
-                                       feels_like=round(weather_dict["main"]["feels_like"], 0),
-                                       wind_speed=round(weather_dict["wind"]["speed"], 0),
-                                       name=location.name,
-                                       country=location.country,
-                                       state=location.state,
-                                       location_id=location.id)
-            locations_with_weather.append(weather_obj)
+            if getattr(location, "city_id", None) is None:
+                continue
+            weather = await weather_cache.get(weather_cache_key(location.latitude, location.longitude,
+                                                                lang="ru", units="metric"))
+            if weather is None:
+                missing.append(location)
+            else:
+                weather_by_location[location.id] = weather
+        batch_size = settings.WEATHER_BATCH_SIZE
+
+        async def fetch(batch: list) -> dict:
+            async with get_global_semaphore():
+                try:
+                    return await self.get_group_weather(batch)
+                except OpenWeatherApiException as e:
+                    # Локации пачки будут запрошены по координатам
+                    logger.warning("Пакетный запрос погоды для {count} локаций не удался: {detail}", count=len(batch),
+                                   detail=e.detail)
+                    return {}
+
+        for batch_weather in await asyncio.gather(*(fetch(missing[start:start + batch_size])
+                                                    for start in range(0, len(missing), batch_size))):
+            weather_by_location.update(batch_weather)
+        return weather_by_location
+
+    @staticmethod
+    def get_weather_check(location, weather_dict: dict, stale_age: int | None = None) -> WeatherCheck:
+        return WeatherCheck(main=weather_dict["weather"][0]["description"].capitalize(),
+                            temp=round(weather_dict["main"]["temp"], 0),
+                            feels_like=round(weather_dict["main"]["feels_like"], 0),
+                            wind_speed=round(weather_dict["wind"]["speed"], 0),
+                            dt=weather_dict.get("dt"),
+                            stale_age=stale_age,
+                            name=location.name,
+                            country=location.country,
+                            state=location.state,
+                            location_id=location.id)
+
+    async def get_location_with_weather(self, location, city_ids: dict | None = None) -> WeatherCheck:
+        try:
+            weather_dict = await self.get_weather_for_location(latitude=location.latitude,
+                                                               longitude=location.longitude)
+        except OpenWeatherApiException as e:
+            # При сбое API показывается последнее известное показание с пометкой о его возрасте
+            stale = await self.get_stale_weather(location.latitude, location.longitude)
+            if stale is not None:
+                return self.get_weather_check(location, *stale)
+            logger.warning("Не удалось получить погоду для локации {location_id}: {detail}", location_id=location.id,
+                           detail=e.detail)
+            return WeatherCheck(name=location.name, country=location.country, state=location.state,
+                                location_id=location.id)
+        if city_ids is not None and getattr(location, "city_id", None) is None and weather_dict.get("id"):
+            city_ids[location.id] = weather_dict["id"]
+        return self.get_weather_check(location, weather_dict)
+
+    async def get_user_locations_with_weather(self, user_locations: list, location_dao=None) -> list:
+        if settings.RECORD_LOCATION_VIEWS:
+            # Просмотры нужны только для очереди фонового обновления, в этом или отдельном процессе
+            await location_views.record([weather_cache_key(location.latitude, location.longitude,
+                                                           lang="ru", units="metric") for location in user_locations])
+        batched_weather = await self.get_batched_weather(user_locations) if settings.WEATHER_BATCH_ENABLED else {}
+        # Локации без city_id запрашиваются по координатам, полученные id сохраняются для следующих пакетов
+        city_ids = {}
+        if not settings.WEATHER_CONCURRENT_FETCH:
+            locations_with_weather = [
+                self.get_weather_check(location, batched_weather[location.id]) if location.id in batched_weather
+                else await self.get_location_with_weather(location, city_ids) for location in user_locations]
+        else:
+            request_semaphore = asyncio.Semaphore(settings.WEATHER_FETCH_CONCURRENCY)
+
+            async def fetch(location) -> WeatherCheck:
+                if location.id in batched_weather:
+                    return self.get_weather_check(location, batched_weather[location.id])
+                async with request_semaphore, get_global_semaphore():
+                    return await self.get_location_with_weather(location, city_ids)
+
+            # gather сохраняет порядок результатов в соответствии с порядком локаций
+            locations_with_weather = list(await asyncio.gather(*(fetch(location) for location in user_locations)))
+        if location_dao is not None and city_ids:
+            await location_dao.set_city_ids(city_ids)
         return locations_with_weather